@@ -11,9 +11,13 @@ Output: data/synth_panel.dta
 
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
 from pathlib import Path
-from load_chatgpt_data import (load_with_zip3, log, get_log_outcome_column,
-                               get_outcome_label, get_output_dir)
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import log, get_log_outcome_column, get_outcome_label, get_output_dir
+from load_data import load_with_zip3
 
 TREATED_ZIP = '606'
 START_DATE = '2023-03-01'
@@ -23,21 +27,25 @@ TREATMENT_DATE = '2023-10-01'
 
 def main():
     # Load transactions
-    trans = load_with_zip3()
-    trans = trans[
-        (trans['trans_date'] >= START_DATE) &
-        (trans['trans_date'] < END_DATE)
-    ].copy()
+    # Date window is applied in the cache scan, so the full sample is never
+    # materialized and then filtered/copied in pandas
+    trans = load_with_zip3(
+        row_filter=(ds.field('trans_date') >= pd.Timestamp(START_DATE))
+                   & (ds.field('trans_date') < pd.Timestamp(END_DATE)))
     log(f"Transactions: {len(trans):,}")
 
     # Aggregate to ZIP3-month
     trans['month'] = trans['trans_date'].dt.to_period('M')
-    monthly = trans.groupby(['zip3', 'month']).agg(
+    # zip3 is categorical: observed=True keeps only ZIP3-months with
+    # transactions (no zero-count cells, whose log would be -inf)
+    monthly = trans.groupby(['zip3', 'month'], observed=True).agg(
         n_users=('cardid', 'nunique'),
         n_trans=('trans_amount', 'count'),
         total_spend=('trans_amount', 'sum'),
         median_price=('trans_amount', 'median')
     ).reset_index()
+    # Plain strings from here on: merges, the ID map and the .dta export
+    monthly['zip3'] = monthly['zip3'].astype(str)
 
     # Convert month to integer (months since 2023-01)
     monthly['month_dt'] = monthly['month'].dt.to_timestamp()
@@ -147,7 +155,7 @@ def main():
     outdir = get_output_dir()
     with open(config_path, 'w') as f:
         f.write(f'* Auto-generated by export_synth_data.py\n')
-        f.write(f'* DO NOT EDIT - change settings in load_chatgpt_data.py\n\n')
+        f.write(f'* DO NOT EDIT - change settings in config.py\n\n')
         f.write(f'global outcome_var "{outcome_var}"\n')
         f.write(f'global outcome_label "{outcome_label}"\n')
         f.write(f'global outdir "{outdir}"\n')
@@ -158,20 +158,22 @@ def main():
         raise FileNotFoundError(f"Run chicago_synth.do first: {results_path}")
 
     results = pd.read_stata(results_path)
-    results['gap'] = results['_Y_treated'] - results['_Y_synthetic']
-    results['gap_sq'] = results['gap'] ** 2
 
-    # RMSPE calculations
-    pre = results[results['_time'] < 10]
-    post = results[results['_time'] >= 10]
+    # Gaps and RMSPE on raw arrays (no intermediate DataFrame columns)
+    gap = (results['_Y_treated'].to_numpy(dtype=float)
+           - results['_Y_synthetic'].to_numpy(dtype=float))
+    gap_sq = gap * gap
+    t = results['_time'].to_numpy()
+    pre_mask = t < 10
+    post_mask = t >= 10
 
-    pre_rmspe = np.sqrt(pre['gap_sq'].mean())
-    post_rmspe = np.sqrt(post['gap_sq'].mean())
+    pre_rmspe = np.sqrt(np.nanmean(gap_sq[pre_mask]))
+    post_rmspe = np.sqrt(np.nanmean(gap_sq[post_mask]))
     rmspe_ratio = post_rmspe / pre_rmspe
 
     # Gaps
-    pre_gap_mean = pre['gap'].mean()
-    post_gap_mean = post['gap'].mean()
+    pre_gap_mean = np.nanmean(gap[pre_mask])
+    post_gap_mean = np.nanmean(gap[post_mask])
 
     # Effect size (percentage)
     effect_pct = (np.exp(post_gap_mean) - 1) * 100
@@ -7,6 +7,7 @@ Or watch mode: watch -n 5 python3 monitor_placebo.py
 Uses TOP QUARTILE placebo run (by pre-treatment outcome level).
 """
 
+import os
 import re
 import sys
 from pathlib import Path
@@ -27,41 +28,101 @@ def get_chicago_stats():
         return 0.0358, 0.127, 3.55
 
     results = pd.read_stata(results_path)
-    results['gap'] = results['_Y_treated'] - results['_Y_synthetic']
-    results['gap_sq'] = results['gap'] ** 2
-
-    pre = results[results['_time'] < 10]
-    post = results[results['_time'] >= 10]
-
-    pre_rmspe = np.sqrt(pre['gap_sq'].mean())
-    post_rmspe = np.sqrt(post['gap_sq'].mean())
+    gap = (results['_Y_treated'].to_numpy(dtype=float)
+           - results['_Y_synthetic'].to_numpy(dtype=float))
+    gap_sq = gap * gap
+    t = results['_time'].to_numpy()
+    pre_mask = t < 10
+    post_mask = t >= 10
+
+    pre_rmspe = np.sqrt(np.nanmean(gap_sq[pre_mask]))
+    post_rmspe = np.sqrt(np.nanmean(gap_sq[post_mask]))
     ratio = post_rmspe / pre_rmspe
 
     return pre_rmspe, post_rmspe, ratio
 
 
+# Pattern: "pre=X, post=Y, ratio=Z"
+PLACEBO_PATTERN = re.compile(r'pre=([\d.]+), post=([\d.]+), ratio=([\d.]+)')
+
+# Parsed rows + byte offset, so repeated `watch` ticks only parse the new tail
+STATE_NAME = 'placebo_monitor_state.npz'
+# Leading bytes of the log kept with the state to tell one run's log from
+# another's (the Stata header carries the run's start time)
+HEAD_BYTES = 1024
+
+
+def _empty_state():
+    """No parsed rows, offset 0."""
+    return np.empty((0, 3)), 0
+
+
+def _load_state(state_path, ino, head):
+    """Return (rows, offset) from the sidecar, or an empty state.
+
+    The sidecar only applies to the log it was written for: same inode, and
+    its recorded head is a prefix of the current one. Otherwise (a restarted
+    placebo run, or an older sidecar format) parsing starts from scratch.
+    """
+    if not state_path.exists():
+        return _empty_state()
+    state = np.load(state_path)
+    if 'ino' not in state.files or int(state['ino']) != ino:
+        return _empty_state()
+    saved_head = state['head'].tobytes()
+    if not head.startswith(saved_head):
+        return _empty_state()
+    return state['rows'], int(state['offset'])
+
+
+def _save_state(state_path, rows, offset, ino, head):
+    """Write the sidecar via a per-process temp file, then swap it in."""
+    tmp_path = state_path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, rows=rows, offset=offset, ino=ino,
+                 head=np.frombuffer(head, dtype=np.uint8))
+    os.replace(tmp_path, state_path)
+
+
 def parse_log():
-    """Parse completed units from log file."""
-    results = []
+    """Parse completed units from log file.
 
+    Parsed rows are checkpointed next to the other outputs with the byte
+    offset reached and the log's identity (inode and first bytes); later
+    calls seek past the offset and parse only new lines. A different log
+    (placebo run restarted) or one that has shrunk is parsed from scratch.
+    """
     repo_root = Path(__file__).parent.parent.parent
     log_path = repo_root / 'chicago_synth_placebo_topq.log'
+    state_path = get_output_dir() / STATE_NAME
+
     try:
-        with open(log_path, 'r') as f:
-            content = f.read()
+        f = open(log_path, 'rb')
     except FileNotFoundError:
-        return results
-
-    # Pattern: "pre=X, post=Y, ratio=Z"
-    pattern = r'pre=([\d.]+), post=([\d.]+), ratio=([\d.]+)'
-
-    for match in re.finditer(pattern, content):
-        pre = float(match.group(1))
-        post = float(match.group(2))
-        ratio = float(match.group(3))
-        results.append({'pre_rmspe': pre, 'post_rmspe': post, 'ratio': ratio})
-
-    return results
+        return []
+
+    with f:
+        st = os.fstat(f.fileno())
+        head = f.read(HEAD_BYTES)
+        rows, offset = _load_state(state_path, st.st_ino, head)
+        if st.st_size < offset:
+            rows, offset = _empty_state()
+        f.seek(offset)
+        tail = f.read()
+
+    # Only consume complete lines; a partial last line is re-read next tick
+    end = tail.rfind(b'\n') + 1
+    if end > 0:
+        text = tail[:end].decode('utf-8', errors='replace')
+        new_rows = [tuple(float(g) for g in m.groups())
+                    for m in PLACEBO_PATTERN.finditer(text)]
+        if new_rows:
+            rows = np.concatenate([rows, np.array(new_rows)])
+        offset += end
+        _save_state(state_path, rows, offset, st.st_ino, head)
+
+    return [{'pre_rmspe': pre, 'post_rmspe': post, 'ratio': ratio}
+            for pre, post, ratio in rows.tolist()]
 
 
 def main():
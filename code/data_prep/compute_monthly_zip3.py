@@ -15,7 +15,8 @@ Run:
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from datetime import datetime
+import matplotlib.colors as mcolors
+import time
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 DROPBOX_OUT = '/Users/jeffreyohl/Dropbox/LLM_PassThrough/output/trans/15to25/all_merchants'
@@ -27,7 +28,7 @@ END_YEAR = 2025
 
 
 def log(msg):
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
 
 
 def get_months():
@@ -185,9 +186,11 @@ def validate_bouncers(tv):
         monthly['zip_num'] = monthly['zip3'].map(zip_to_num)
 
         ax = axes[idx]
-        for _, row in monthly.iterrows():
-            alpha = max(0.3, row['pct'])
-            ax.scatter(row['date'], row['zip_num'], c='steelblue', alpha=alpha, s=50)
+        # Per-point alpha via RGBA array: one scatter call instead of one per month
+        colors = np.zeros((len(monthly), 4))
+        colors[:, :3] = mcolors.to_rgb('steelblue')
+        colors[:, 3] = np.maximum(0.3, monthly['pct'].to_numpy())
+        ax.scatter(monthly['date'], monthly['zip_num'], c=colors, s=50)
         ax.plot(monthly['date'], monthly['zip_num'], 'steelblue', alpha=0.3)
         ax.set_yticks(range(len(unique_zips)))
         ax.set_yticklabels(unique_zips)
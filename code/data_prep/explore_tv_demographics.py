@@ -24,7 +24,9 @@ def main():
         sys.exit(1)
 
     print(f"Loading {tv_demo_path}...")
-    df = pd.read_parquet(tv_demo_path)
+    # All columns: this script reports the full schema
+    df = pd.read_parquet(tv_demo_path, engine='pyarrow', use_threads=True,
+                         memory_map=True)
 
     # Schema
     print(f"\n=== SCHEMA ===")
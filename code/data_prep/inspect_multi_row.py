@@ -3,14 +3,66 @@
 Inspect a few multi-row cardids to sanity check modal ZIP3 computation.
 """
 
+import numpy as np
 import pandas as pd
+from tv_cache import read_tv
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
+
+
+# Sample months, with start/end day numbers precomputed once for all examples
+TEST_MONTHS = pd.date_range('2023-01-01', '2024-01-01', freq='MS')
+
+
+def _to_days(values):
+    """Dates -> int64 day numbers."""
+    return np.asarray(values, dtype='datetime64[D]').astype(np.int64)
+
+
+MONTH_STARTS = _to_days(TEST_MONTHS)
+MONTH_ENDS = _to_days(TEST_MONTHS + pd.offsets.MonthEnd(1))
+
+
+def zip_days_by_month(rows, month_starts=MONTH_STARTS, month_ends=MONTH_ENDS):
+    """Days each ZIP covers in each month, as a (zip x month) array.
+
+    Builds the (rows x months) interval-overlap matrix in one broadcast and
+    sums it by ZIP, instead of looping over rows for every month. Returns
+    the array, the ZIP label for each row of it, and the (zip x month) index
+    of the first row that covers that ZIP in that month (len(rows) if none).
+    """
+    begin = _to_days(rows['valid_begin'])
+    end = _to_days(rows['valid_end'])
+
+    # Inclusive overlap in days; negative (no overlap) clipped to 0
+    days = np.clip(np.minimum(end[:, None], month_ends[None, :])
+                   - np.maximum(begin[:, None], month_starts[None, :]) + 1, 0, None)
+
+    zip_codes, zip_labels = pd.factorize(rows['zip'].astype(str))
+    totals = np.zeros((len(zip_labels), len(month_starts)), dtype=np.int64)
+    np.add.at(totals, zip_codes, days)
+
+    row_idx = np.where(days > 0, np.arange(len(days))[:, None], len(days))
+    first_seen = np.full(totals.shape, len(days), dtype=np.int64)
+    np.minimum.at(first_seen, zip_codes, row_idx)
+    return totals, np.asarray(zip_labels), first_seen
+
+
+def monthly_ranking(days, first_seen):
+    """ZIP rows of every month ranked by days covered, and total covered days.
+
+    Ties go to the ZIP seen first among that month's rows (in valid_begin
+    order), as a per-month running tally would. Row 0 of the ranking is the
+    modal ZIP.
+    """
+    return np.lexsort((first_seen, -days), axis=0), days.sum(axis=0)
+
 
 def main():
     print("Loading address_map...")
-    tv = pd.read_parquet(TV_PATH)
+    tv = read_tv(TV_PATH, TV_COLUMNS)
     tv['valid_begin'] = pd.to_datetime(tv['valid_begin'])
     tv['valid_end'] = pd.to_datetime(tv['valid_end'])
 
@@ -38,46 +90,41 @@ def main():
         ("20+ rows", heavy_bounce),
     ]
 
+    # Index by cardid once so each example is a sorted-index slice, not a scan
+    tv_by_card = tv.set_index('cardid', drop=False).sort_index()
+
     for label, cardid in examples:
         print(f"\n{'='*60}")
         print(f"EXAMPLE: {label}")
         print(f"Cardid: {cardid[:30]}...")
         print("="*60)
 
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
+        rows = tv_by_card.loc[[cardid]].sort_values('valid_begin')
         print(f"\nRaw address_map rows ({len(rows)}):")
-        for _, r in rows.iterrows():
-            days = (r['valid_end'] - r['valid_begin']).days + 1
-            print(f"  ZIP {r['zip']:>3} | "
-                  f"{r['valid_begin'].strftime('%Y-%m-%d')} to "
-                  f"{r['valid_end'].strftime('%Y-%m-%d')} "
+        for r in rows.itertuples(index=False):
+            days = (r.valid_end - r.valid_begin).days + 1
+            print(f"  ZIP {r.zip:>3} | "
+                  f"{r.valid_begin.strftime('%Y-%m-%d')} to "
+                  f"{r.valid_end.strftime('%Y-%m-%d')} "
                   f"({days:,} days)")
 
         # Compute modal for a few months
         print(f"\nModal ZIP3 by month (sample):")
-        test_months = pd.date_range('2023-01-01', '2024-01-01', freq='MS')
-
-        for m in test_months:
-            m_end = m + pd.offsets.MonthEnd(1)
-            days_per_zip = {}
-
-            for _, r in rows.iterrows():
-                if r['valid_begin'] <= m_end and r['valid_end'] >= m:
-                    start = max(r['valid_begin'], m)
-                    end = min(r['valid_end'], m_end)
-                    days = (end - start).days + 1
-                    z = str(r['zip'])
-                    days_per_zip[z] = days_per_zip.get(z, 0) + days
-
-            if days_per_zip:
-                modal = max(days_per_zip, key=days_per_zip.get)
-                total = sum(days_per_zip.values())
-                pct = days_per_zip[modal] / total * 100
-                breakdown = ", ".join(f"{z}:{d}d" for z, d in
-                                      sorted(days_per_zip.items(),
-                                             key=lambda x: -x[1]))
-                print(f"  {m.strftime('%Y-%m')}: {modal} "
-                      f"({pct:.0f}% of {total}d) [{breakdown}]")
+        days, zip_labels, first_seen = zip_days_by_month(rows)
+        ranking, totals = monthly_ranking(days, first_seen)
+
+        for j, m in enumerate(TEST_MONTHS):
+            total = totals[j]
+            if total == 0:
+                continue
+            col = days[:, j]
+            order = ranking[:, j]
+            order = order[col[order] > 0]
+            modal = zip_labels[order[0]]
+            pct = col[order[0]] / total * 100
+            breakdown = ", ".join(f"{zip_labels[k]}:{col[k]}d" for k in order)
+            print(f"  {m.strftime('%Y-%m')}: {modal} "
+                  f"({pct:.0f}% of {total}d) [{breakdown}]")
 
 
 if __name__ == "__main__":
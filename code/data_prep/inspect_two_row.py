@@ -2,13 +2,15 @@
 """Show several 2-row cardids to see the pattern."""
 
 import pandas as pd
+from tv_cache import read_tv
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
 
 def main():
     print("Loading address_map...")
-    tv = pd.read_parquet(TV_PATH)
+    tv = read_tv(TV_PATH, TV_COLUMNS)
     tv['valid_begin'] = pd.to_datetime(tv['valid_begin'])
     tv['valid_end'] = pd.to_datetime(tv['valid_end'])
 
@@ -28,8 +30,11 @@ def main():
     print("SAMPLE OF 2-ROW CARDIDS")
     print("="*70)
 
+    # Index by cardid once so each sample is a sorted-index slice, not a scan
+    tv_by_card = tv.set_index('cardid', drop=False).sort_index()
+
     for cardid in sample:
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
+        rows = tv_by_card.loc[[cardid]].sort_values('valid_begin')
         r1, r2 = rows.iloc[0], rows.iloc[1]
 
         # Check if ZIPs are same or different
@@ -54,22 +59,18 @@ def main():
     print("SUMMARY STATS FOR 2-ROW CARDIDS")
     print("="*70)
 
-    same_zip_count = 0
-    real_mover_count = 0
-
-    for cardid in two_row_cardids[:5000]:  # Sample for speed
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
-        r1, r2 = rows.iloc[0], rows.iloc[1]
-        if str(r1['zip']) == str(r2['zip']):
-            same_zip_count += 1
-        else:
-            real_mover_count += 1
+    # One vectorized pass: distinct ZIPs per 2-row cardid (1 = same, 2 = mover)
+    two_row = tv[tv['cardid'].isin(two_row_cardids)]
+    n_zips = two_row['zip'].astype(str).groupby(two_row['cardid'], sort=False).nunique()
+    n_total = len(n_zips)
+    same_zip_count = int((n_zips == 1).sum())
+    real_mover_count = n_total - same_zip_count
 
-    print(f"\nOf first 5,000 2-row cardids:")
+    print(f"\nOf all {n_total:,} 2-row cardids:")
     print(f"  Same ZIP in both rows: {same_zip_count:,} "
-          f"({same_zip_count/5000*100:.1f}%)")
+          f"({same_zip_count/n_total*100:.1f}%)")
     print(f"  Different ZIP (mover): {real_mover_count:,} "
-          f"({real_mover_count/5000*100:.1f}%)")
+          f"({real_mover_count/n_total*100:.1f}%)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+One-time schema normalization for chatgpt_demographics_tv.parquet.
+
+Rewrites valid_begin/valid_end as typed timestamps so every downstream
+script (inspect_*, plot_two_row_examples, compute_monthly_zip3, ...) gets
+datetime64 columns straight from the parquet and its pd.to_datetime call
+becomes a no-op. String ZIP columns are dictionary-encoded (few distinct
+values, many rows). Safe to re-run: already-typed columns are left as is.
+
+cardid is left as plain strings: ~80% of cardids have a single row, so a
+dictionary would be about as large as the column itself.
+
+Run:
+    python3 code/data_prep/normalize_tv_dates.py
+"""
+
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
+TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
+
+DATE_COLS = ['valid_begin', 'valid_end']
+DICT_COLS = ['zip', 'zip3']
+
+
+def main():
+    print("Loading address_map...")
+    table = pq.read_table(TV_PATH)
+    print(f"  Rows: {table.num_rows:,}")
+    print(f"  Schema before:\n{table.schema}")
+
+    for col in DATE_COLS:
+        i = table.schema.get_field_index(col)
+        if pa.types.is_timestamp(table.schema.field(col).type):
+            continue
+        parsed = pd.to_datetime(table.column(col).to_pandas())
+        table = table.set_column(i, col, pa.array(parsed, type=pa.timestamp('us')))
+
+    for col in DICT_COLS:
+        i = table.schema.get_field_index(col)
+        if i < 0 or not pa.types.is_string(table.schema.field(col).type):
+            continue
+        table = table.set_column(i, col, pc.dictionary_encode(table.column(col)))
+
+    # Write next to the original, then swap in atomically
+    tmp_path = f'{TV_PATH}.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, TV_PATH)
+    print(f"  Schema after:\n{table.schema}")
+    print(f"Saved to {TV_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@
 Panelization: Implement CEdge's "Constant Individual Panel" methodology.
 Keep only cardlinkids with ≥1 transaction in every 70-day window.
 
-Memory-conscious: reads parquet in chunks, processes incrementally.
+Memory-conscious: streams filtered parquet batches into a compact Feather
+cache once, then answers every window from the memory-mapped cache.
 """
 
-import pyarrow.parquet as pq
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pandas as pd
 import numpy as np
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
@@ -18,6 +24,17 @@ DATA_DIR = Path("/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data")
 STUDY_START = pd.Timestamp('2023-03-01')
 STUDY_END = pd.Timestamp('2024-11-30')
 WINDOW_DAYS = 70
+EPOCH = pd.Timestamp('1970-01-01')
+
+CARD_INFO_PATH = DATA_DIR / "chatgpt_card_info_2025_12_26.parquet"
+ACTIVITY_FILES = [
+    DATA_DIR / "activity_dates_2023.parquet",
+    DATA_DIR / "activity_dates_2024.parquet",
+]
+# Filtered (card_idx, trans_date) rows for the study period, reused across runs
+ACTIVITY_CACHE = DATA_DIR / (
+    f"activity_panel_sortedidx_{STUDY_START:%Y%m%d}_{STUDY_END:%Y%m%d}.feather"
+)
 
 
 def log(msg):
@@ -53,7 +70,7 @@ def generate_windows(start, end, window_days):
 def load_card_info():
     """Load card info and filter out USA1 debit cards."""
     log("Loading card info...")
-    card_info = pd.read_parquet(DATA_DIR / "chatgpt_card_info_2025_12_26.parquet")
+    card_info = pd.read_parquet(CARD_INFO_PATH)
     log(f"  Total cards: {len(card_info):,}")
 
     # Exclude USA1 debit cards (source_group == 1 AND cardtype == 'DEBIT')
@@ -64,36 +81,110 @@ def load_card_info():
     return card_info[['cardid', 'cardlinkid']]
 
 
-def get_cardlinkids_in_window(parquet_path, cardid_to_linkid, win_start, win_end):
-    """Stream through parquet and collect cardlinkids active in this window.
+def _date_bound(ts, arrow_type):
+    """Express a Timestamp as a scalar comparable with an Arrow date column."""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return ts.strftime('%Y-%m-%d')
+    return pa.scalar(ts.to_pydatetime()).cast(arrow_type)
+
+
+def _to_date32(column):
+    """Cast a trans_date batch column (string or temporal) to date32."""
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        column = pc.utf8_slice_codeunits(column, 0, 10)
+    return pc.cast(column, pa.date32(), safe=False)
+
 
-    Reads row groups one at a time to limit memory.
+def build_activity_cache(cardids, cache_path):
+    """Scan activity files once and write the compact (card_idx, date) table.
+
+    The study-period filter is pushed into the Arrow scan, so row groups
+    outside the period are skipped by statistics. Each cardid is then
+    dictionary-encoded against the sorted valid-card array with one hash lookup
+    (pc.index_in), which doubles as the membership filter; the cache stores
+    that int32 position instead of the string. Batches are streamed straight
+    into an uncompressed Arrow IPC (Feather v2) file so the build never holds
+    the full table. The file is written under a per-process temp name and
+    moved into place only once every scan has finished, so a failed build
+    never leaves a truncated cache that looks fresh.
+    """
+    valid_cardids = pa.array(cardids)
+    schema = pa.schema([('card_idx', pa.int32()), ('trans_date', pa.date32())])
+
+    tmp_path = Path(cache_path).with_suffix(f'.{os.getpid()}.tmp')
+    with pa.ipc.new_file(str(tmp_path), schema) as writer:
+        for f in ACTIVITY_FILES:
+            log(f"  Scanning {f.name}...")
+            dataset = ds.dataset(f, format='parquet')
+            date_type = dataset.schema.field('trans_date').type
+            row_filter = (
+                (ds.field('trans_date') >= _date_bound(STUDY_START, date_type)) &
+                (ds.field('trans_date') <= _date_bound(STUDY_END, date_type))
+            )
+            n_rows = 0
+            for batch in dataset.to_batches(columns=['cardid', 'trans_date'],
+                                            filter=row_filter, batch_size=1_000_000):
+                card_idx = pc.index_in(batch.column('cardid'), value_set=valid_cardids)
+                keep = pc.is_valid(card_idx)
+                card_idx = card_idx.filter(keep)
+                if len(card_idx) == 0:
+                    continue
+                writer.write_batch(pa.record_batch(
+                    [card_idx,
+                     _to_date32(batch.column('trans_date').filter(keep))],
+                    schema=schema,
+                ))
+                n_rows += len(card_idx)
+            log(f"    Kept {n_rows:,} rows")
+    os.replace(tmp_path, cache_path)
+
+
+def load_activity(cardids):
+    """Return the filtered activity table, decoding the parquet files only once.
+
+    The (card_idx, trans_date) rows for panel-eligible cards are cached as
+    Feather next to the source data and memory-mapped on later runs. The
+    cache is rebuilt whenever an activity file or the card info is newer.
     """
-    valid_cardids = set(cardid_to_linkid.keys())
-    active_linkids = set()
+    sources = ACTIVITY_FILES + [CARD_INFO_PATH]
+    fresh = (ACTIVITY_CACHE.exists() and
+             ACTIVITY_CACHE.stat().st_mtime > max(f.stat().st_mtime for f in sources))
+    if not fresh:
+        log(f"Building activity cache: {ACTIVITY_CACHE.name}")
+        build_activity_cache(cardids, ACTIVITY_CACHE)
+    else:
+        log(f"Using cached activity: {ACTIVITY_CACHE.name}")
 
-    pf = pq.ParquetFile(parquet_path)
+    with pa.memory_map(str(ACTIVITY_CACHE)) as source:
+        activity = pa.ipc.open_file(source).read_all()
+    log(f"  Activity rows: {activity.num_rows:,}")
+    return activity
 
-    for i in range(pf.metadata.num_row_groups):
-        # Read one row group at a time
-        table = pf.read_row_group(i)
-        chunk = table.to_pandas()
 
-        # Filter to valid cardids
-        chunk = chunk[chunk['cardid'].isin(valid_cardids)]
+def _epoch_day(ts):
+    """Timestamp -> int32 day count, matching date32 storage."""
+    return np.int32((ts.normalize() - EPOCH).days)
 
-        # Filter to date window
-        chunk['trans_date'] = pd.to_datetime(chunk['trans_date'])
-        chunk = chunk[(chunk['trans_date'] >= win_start) & (chunk['trans_date'] <= win_end)]
 
-        if len(chunk) > 0:
-            # Map to cardlinkid and collect
-            linkids = chunk['cardid'].map(cardid_to_linkid).unique()
-            active_linkids.update(linkids)
+# Per-process activity arrays, set by _init_worker
+_WORKER = {}
 
-        del chunk, table
 
-    return active_linkids
+def _init_worker(codes_path, dates_path, n_linkids):
+    """Memory-map the shared activity arrays once per worker process."""
+    _WORKER['codes'] = np.load(codes_path, mmap_mode='r')
+    _WORKER['dates'] = np.load(dates_path, mmap_mode='r')
+    _WORKER['n_linkids'] = n_linkids
+
+
+def window_mask(bounds):
+    """Bool mask over cardlinkid codes active in one (inclusive) day window."""
+    win_start, win_end = bounds
+    dates = _WORKER['dates']
+    in_window = (dates >= win_start) & (dates <= win_end)
+    mask = np.zeros(_WORKER['n_linkids'], dtype=bool)
+    mask[_WORKER['codes'][in_window]] = True
+    return mask
 
 
 def main():
@@ -103,9 +194,14 @@ def main():
 
     # Step 1: Load card info
     card_info = load_card_info()
-    cardid_to_linkid = dict(zip(card_info['cardid'], card_info['cardlinkid']))
-    all_cardlinkids = set(card_info['cardlinkid'].unique())
-    log(f"  Unique cardlinkids: {len(all_cardlinkids):,}")
+    # Sorted unique cardids; the activity cache stores positions into this array
+    card_info = card_info.drop_duplicates('cardid', keep='last').sort_values('cardid')
+    cardids = card_info['cardid'].to_numpy()
+    # Dense int codes for cardlinkids (aligned with cardids), so window
+    # membership is a bitmask and cardid -> cardlinkid is an integer gather
+    link_codes, link_labels = pd.factorize(card_info['cardlinkid'])
+    n_linkids = len(link_labels)
+    log(f"  Unique cardlinkids: {n_linkids:,}")
     del card_info
 
     # Step 2: Generate windows
@@ -114,29 +210,39 @@ def main():
     for i, (start, end) in enumerate(windows):
         log(f"  Window {i+1}: {start.date()} to {end.date()}")
 
-    # Step 3: For each window, find active cardlinkids
-    # Start with all cardlinkids, then intersect with each window's active set
-    panel_members = all_cardlinkids.copy()
-
-    activity_files = [
-        DATA_DIR / "activity_dates_2023.parquet",
-        DATA_DIR / "activity_dates_2024.parquet"
-    ]
-
-    for i, (win_start, win_end) in enumerate(windows):
-        log(f"Processing window {i+1}: {win_start.date()} to {win_end.date()}")
-
-        window_active = set()
-        for f in activity_files:
-            log(f"  Scanning {f.name}...")
-            active = get_cardlinkids_in_window(f, cardid_to_linkid, win_start, win_end)
-            window_active.update(active)
-            log(f"    Found {len(active):,} active cardlinkids")
-
+    # Step 3: Decode activity once, then answer every window from memory
+    activity = load_activity(cardids)
+    codes = link_codes[activity.column('card_idx').to_numpy()]
+    # date32 storage is int32 days since epoch; compare on that directly
+    dates = pc.cast(activity.column('trans_date'), pa.int32()).to_numpy()
+    del activity
+
+    # Windows are independent: compute each active mask in its own process.
+    # Arrays are handed over as .npy files that workers memory-map.
+    bounds = [(_epoch_day(s), _epoch_day(e)) for s, e in windows]
+    with tempfile.TemporaryDirectory() as tmp:
+        codes_path = Path(tmp) / 'codes.npy'
+        dates_path = Path(tmp) / 'dates.npy'
+        np.save(codes_path, codes)
+        np.save(dates_path, dates)
+        del codes, dates
+        n_workers = min(len(windows), os.cpu_count() or 1)
+        log(f"Computing {len(windows)} window masks on {n_workers} workers...")
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(codes_path, dates_path, n_linkids)) as pool:
+            masks = list(pool.map(window_mask, bounds, chunksize=1))
+
+    # Start with all cardlinkids, then AND with each window's active mask
+    panel_mask = np.ones(n_linkids, dtype=bool)
+
+    for i, mask in enumerate(masks):
         # Intersect: keep only those active in this window
-        before = len(panel_members)
-        panel_members = panel_members.intersection(window_active)
-        log(f"  Window {i+1}: {len(window_active):,} active, panel now {len(panel_members):,} (dropped {before - len(panel_members):,})")
+        before = int(panel_mask.sum())
+        panel_mask &= mask
+        after = int(panel_mask.sum())
+        log(f"  Window {i+1}: {int(mask.sum()):,} active, panel now {after:,} (dropped {before - after:,})")
+
+    panel_members = link_labels[panel_mask]
 
     # Step 4: Save panel members
     output_path = DATA_DIR / "panel_cardlinkids.parquet"
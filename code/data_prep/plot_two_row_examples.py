@@ -4,41 +4,37 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-import random
+from tv_cache import read_tv
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 DROPBOX_OUT = '/Users/jeffreyohl/Dropbox/LLM_PassThrough/output/trans/15to25/all_merchants'
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
 
 def main():
     print("Loading address_map...")
-    tv = pd.read_parquet(TV_PATH)
+    tv = read_tv(TV_PATH, TV_COLUMNS)
     tv['valid_begin'] = pd.to_datetime(tv['valid_begin'])
     tv['valid_end'] = pd.to_datetime(tv['valid_end'])
 
-    # Find 2-row cardids with different ZIPs (real movers)
-    counts = tv.groupby('cardid').size()
-    two_row_cardids = counts[counts == 2].index.tolist()
-
-    # Find movers vs same-zip
-    movers = []
-    same_zip = []
-
-    for cardid in two_row_cardids[:10000]:
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
-        r1, r2 = rows.iloc[0], rows.iloc[1]
-        if str(r1['zip']) != str(r2['zip']):
-            movers.append(cardid)
-        else:
-            same_zip.append(cardid)
-
-    print(f"In first 10k 2-row cardids:")
+    # Find 2-row cardids with different ZIPs (real movers), in one pass:
+    # first/last ZIP per cardid after sorting by valid_begin
+    tv_sorted = tv.sort_values(['cardid', 'valid_begin'])
+    by_card = tv_sorted.groupby('cardid', sort=False)
+    zips = tv_sorted['zip'].astype(str).groupby(tv_sorted['cardid'])
+    agg = zips.agg(['first', 'last', 'size'])
+    two_row = agg[agg['size'] == 2]
+    is_mover = two_row['first'] != two_row['last']
+    movers = two_row.index[is_mover]
+    same_zip = two_row.index[~is_mover]
+
+    print(f"Of {len(two_row):,} 2-row cardids:")
     print(f"  Movers (diff ZIP): {len(movers):,}")
     print(f"  Same ZIP: {len(same_zip):,}")
 
     # Plot 6 examples: 3 movers, 3 same-zip
-    random.seed(42)
-    examples = random.sample(movers[:500], 3) + random.sample(same_zip[:500], 3)
+    examples = (movers.to_series().sample(3, random_state=42).tolist() +
+                same_zip.to_series().sample(3, random_state=42).tolist())
 
     fig, axes = plt.subplots(2, 3, figsize=(14, 6))
     axes = axes.flatten()
@@ -47,25 +43,25 @@ def main():
 
     for idx, cardid in enumerate(examples):
         ax = axes[idx]
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
+        rows = by_card.get_group(cardid)  # already sorted by valid_begin
 
         # Get unique ZIPs for color mapping
         zips = rows['zip'].astype(str).unique()
         zip_colors = {z: colors[i % len(colors)] for i, z in enumerate(zips)}
 
-        for _, row in rows.iterrows():
-            z = str(row['zip'])
+        for row in rows.itertuples(index=False):
+            z = str(row.zip)
             ax.barh(
                 y=0,
-                width=(row['valid_end'] - row['valid_begin']).days,
-                left=row['valid_begin'],
+                width=(row.valid_end - row.valid_begin).days,
+                left=row.valid_begin,
                 height=0.5,
                 color=zip_colors[z],
                 edgecolor='black',
                 linewidth=0.5
             )
             # Label
-            mid = row['valid_begin'] + (row['valid_end'] - row['valid_begin']) / 2
+            mid = row.valid_begin + (row.valid_end - row.valid_begin) / 2
             ax.text(mid, 0, z, ha='center', va='center',
                     fontsize=10, fontweight='bold')
 
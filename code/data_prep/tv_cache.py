@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Feather cache for column subsets of chatgpt_demographics_tv.parquet.
+
+The inspect_*/validate_*/visualize_* scripts all read the same few columns
+of the same file. The first read writes those columns to an uncompressed
+Arrow IPC file next to the parquet; later runs memory-map it instead of
+decompressing the parquet again. A cache older than the parquet is rebuilt.
+"""
+
+import os
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+def cache_path(tv_path, columns):
+    """Cache file for this column list, next to the source parquet."""
+    stem, _ = os.path.splitext(tv_path)
+    return f"{stem}.{'-'.join(columns)}.feather"
+
+
+def read_tv(tv_path, columns):
+    """Read `columns` of the tv parquet as a DataFrame, via the Feather cache."""
+    path = cache_path(tv_path, columns)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(tv_path):
+        table = pq.read_table(tv_path, columns=columns, use_threads=True, memory_map=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+    return feather.read_table(path, memory_map=True).to_pandas()
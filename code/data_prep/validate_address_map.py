@@ -18,11 +18,17 @@ Run:
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from datetime import datetime
+from tv_cache import read_tv
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
 CHANGERS_PATH = f'{CEDGE_DATA}/zip_changers_jul_dec.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
+CHANGERS_COLUMNS = ['cardid', 'zip_jul', 'zip_dec']
 
 
 def log(msg):
@@ -36,16 +42,24 @@ def main():
 
     # Load data
     log("Loading demographics_tv (from cardid_address_map)...")
-    tv = pd.read_parquet(TV_PATH)
+    tv = read_tv(TV_PATH, TV_COLUMNS)
     log(f"  Rows: {len(tv):,}, Unique cardids: {tv['cardid'].nunique():,}")
 
     log("Loading zip changers (card table Jul->Dec)...")
-    changers = pd.read_parquet(CHANGERS_PATH)
+    changers = pd.read_parquet(CHANGERS_PATH, columns=CHANGERS_COLUMNS, engine='pyarrow')
     log(f"  Changers: {len(changers):,}")
 
+    # Categorical cardid with one shared category set, so groupby and merge
+    # hash int codes rather than strings
+    cats = pd.Index(tv['cardid'].unique()).union(changers['cardid'].unique())
+    tv['cardid'] = pd.Categorical(tv['cardid'], categories=cats)
+    changers['cardid'] = pd.Categorical(changers['cardid'], categories=cats)
+
     # Basic stats on address_map
     log("\n--- ADDRESS_MAP STRUCTURE ---")
-    counts = tv.groupby('cardid').size()
+    # One grouping, reused for every per-cardid count below
+    gb = tv.groupby('cardid', sort=False, observed=True)
+    counts = gb.size()
     movers_in_map = (counts > 1).sum()
     log(f"Cardids with >1 address row: {movers_in_map:,} "
         f"({100*movers_in_map/len(counts):.1f}%)")
@@ -59,26 +73,31 @@ def main():
     changers['zip_dec_str'] = changers['zip_dec'].astype(str)
 
     # Count address_map rows per cardid
-    map_counts = tv.groupby('cardid').size().rename('address_map_rows')
+    map_counts = counts.rename('address_map_rows')
+
+    # Distinct (cardid, ZIP) pairs, restricted to changers before dedup so
+    # the joins below only see the rows they can match
+    in_changers = tv['cardid'].isin(changers['cardid'])
+    changer_pairs = tv.loc[in_changers, ['cardid', 'zip_str']].drop_duplicates()
 
-    # Get all ZIPs per cardid as sets
-    map_zips = tv.groupby('cardid')['zip_str'].apply(set).rename('address_map_zips')
+    # ZIP lists for printing and the saved output
+    map_zips = changer_pairs.groupby('cardid', sort=False, observed=True)['zip_str'].agg(list).rename('address_map_zips')
 
     # Merge onto changers
     results_df = changers.merge(map_counts, on='cardid', how='left')
     results_df = results_df.merge(map_zips, on='cardid', how='left')
     results_df['address_map_rows'] = results_df['address_map_rows'].fillna(0).astype(int)
     results_df['address_map_zips'] = results_df['address_map_zips'].apply(
-        lambda x: x if isinstance(x, set) else set()
+        lambda x: x if isinstance(x, list) else []
     )
 
     # Check if address_map has the July and Dec ZIPs
-    results_df['has_jul_zip'] = results_df.apply(
-        lambda r: r['zip_jul_str'] in r['address_map_zips'], axis=1
-    )
-    results_df['has_dec_zip'] = results_df.apply(
-        lambda r: r['zip_dec_str'] in r['address_map_zips'], axis=1
-    )
+    for period in ['jul', 'dec']:
+        hits = results_df[['cardid', f'zip_{period}_str']].merge(
+            changer_pairs, left_on=['cardid', f'zip_{period}_str'],
+            right_on=['cardid', 'zip_str'], how='left', indicator=True
+        )
+        results_df[f'has_{period}_zip'] = (hits['_merge'] == 'both').to_numpy()
     results_df['has_both'] = results_df['has_jul_zip'] & results_df['has_dec_zip']
 
     # Summary stats
@@ -106,19 +125,24 @@ def main():
     # Show examples
     log("\n--- EXAMPLES: Changers with address_map data ---")
     examples = results_df[results_df['address_map_rows'] > 0].head(10)
-    for _, r in examples.iterrows():
-        log(f"  Card: {r['zip_jul']} -> {r['zip_dec']} | "
-            f"Map rows: {r['address_map_rows']}, "
-            f"Map ZIPs: {r['address_map_zips']}, "
-            f"Has both: {r['has_both']}")
+    # One log call per block rather than per line
+    log("\n".join(
+        f"  Card: {r.zip_jul} -> {r.zip_dec} | "
+        f"Map rows: {r.address_map_rows}, "
+        f"Map ZIPs: {r.address_map_zips}, "
+        f"Has both: {r.has_both}"
+        for r in examples.itertuples(index=False)
+    ))
 
     # Show examples of mismatches
     log("\n--- EXAMPLES: Changers NOT captured by address_map ---")
     misses = results_df[~results_df['has_both']].head(10)
-    for _, r in misses.iterrows():
-        log(f"  Card: {r['zip_jul']} -> {r['zip_dec']} | "
-            f"Map rows: {r['address_map_rows']}, "
-            f"Map ZIPs: {r['address_map_zips']}")
+    log("\n".join(
+        f"  Card: {r.zip_jul} -> {r.zip_dec} | "
+        f"Map rows: {r.address_map_rows}, "
+        f"Map ZIPs: {r.address_map_zips}"
+        for r in misses.itertuples(index=False)
+    ))
 
     # Investigate address_map date patterns
     log("\n--- ADDRESS_MAP DATE PATTERNS ---")
@@ -129,17 +153,19 @@ def main():
     log(f"valid_end range: {tv['valid_end'].min()} to {tv['valid_end'].max()}")
 
     # For cardids with multiple rows, show date transitions
-    multi_row = tv[tv['cardid'].isin(counts[counts > 1].index)]
+    multi_row = tv[gb['zip'].transform('size').to_numpy() > 1]
     log(f"\nCardids with multiple address rows: {multi_row['cardid'].nunique():,}")
 
     # Sample a few movers to see date patterns
     log("\n--- SAMPLE MOVERS FROM ADDRESS_MAP ---")
     sample_movers = multi_row['cardid'].unique()[:5]
+    lines = []
     for cardid in sample_movers:
-        rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
-        log(f"\nCardid: {cardid[:20]}...")
-        for _, r in rows.iterrows():
-            log(f"  ZIP {r['zip']}: {r['valid_begin']} to {r['valid_end']}")
+        rows = gb.get_group(cardid).sort_values('valid_begin')
+        lines.append(f"\nCardid: {cardid[:20]}...")
+        lines.extend(f"  ZIP {r.zip}: {r.valid_begin} to {r.valid_end}"
+                     for r in rows.itertuples(index=False))
+    log("\n".join(lines))
 
     # Check if any changers show up in multi-row address_map records
     changers_with_multi = results_df[results_df['address_map_rows'] > 1]
@@ -149,9 +175,18 @@ def main():
 
     # Save detailed results
     out_path = f'{CEDGE_DATA}/address_map_validation.parquet'
-    # Convert sets to lists for parquet compatibility
-    results_df['address_map_zips'] = results_df['address_map_zips'].apply(list)
-    results_df.to_parquet(out_path, index=False)
+    # cardid back to plain strings: the shared categorical would otherwise
+    # write a dictionary of every tv cardid into the file
+    results_df['cardid'] = results_df['cardid'].astype(str)
+    table = pa.Table.from_pandas(results_df, preserve_index=False)
+    # Dictionary-encode the ZIPs inside the list column (few distinct values)
+    zips = table.column('address_map_zips').combine_chunks()
+    zips = pa.ListArray.from_arrays(zips.offsets, pc.dictionary_encode(zips.values))
+    table = table.set_column(
+        table.schema.get_field_index('address_map_zips'), 'address_map_zips', zips
+    )
+    pq.write_table(table, out_path, compression='zstd', compression_level=3,
+                   use_dictionary=True)
     log(f"\nSaved detailed results to {out_path}")
 
     log("\n" + "=" * 60)
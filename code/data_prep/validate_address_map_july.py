@@ -10,12 +10,16 @@ Run:
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from datetime import datetime
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
 CARD_INFO_PATH = f'{CEDGE_DATA}/chatgpt_card_info_2025_12_26.parquet'
 CHANGERS_PATH = f'{CEDGE_DATA}/zip_changers_jul_dec.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
 
 JULY_DATE = pd.Timestamp('2025-07-04')
 
@@ -24,22 +28,43 @@ def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
 
 
+def _naive_datetimes(col):
+    """Parse a valid_begin/valid_end column to tz-naive datetime64."""
+    col = pd.to_datetime(col)
+    if col.dt.tz is not None:
+        col = col.dt.tz_localize(None)
+    return col
+
+
+def load_tv_july():
+    """Address_map rows valid on JULY_DATE.
+
+    Typed already if normalize_tv_dates.py has been run: then the date
+    predicate is pushed into the parquet scan so row groups outside it are
+    skipped. Otherwise (string or tz-aware columns, which a naive scalar
+    can't be compared with) read the columns and filter in pandas.
+    """
+    dataset = ds.dataset(TV_PATH, format='parquet')
+    date_type = dataset.schema.field('valid_begin').type
+    if (pa.types.is_timestamp(date_type) and date_type.tz is None) or pa.types.is_date(date_type):
+        july = pa.scalar(JULY_DATE.to_pydatetime()).cast(date_type)
+        expr = (ds.field('valid_begin') <= july) & (ds.field('valid_end') >= july)
+        return dataset.to_table(columns=TV_COLUMNS, filter=expr).to_pandas()
+
+    tv = dataset.to_table(columns=TV_COLUMNS).to_pandas()
+    valid = ((_naive_datetimes(tv['valid_begin']) <= JULY_DATE) &
+             (_naive_datetimes(tv['valid_end']) >= JULY_DATE))
+    return tv[valid].reset_index(drop=True)
+
+
 def main():
     log("=" * 60)
     log("VALIDATE: address_map July ZIP vs card table July ZIP")
     log("=" * 60)
 
-    # Load address_map
-    log("Loading address_map (demographics_tv)...")
-    tv = pd.read_parquet(TV_PATH)
-    log(f"  Rows: {len(tv):,}, Cardids: {tv['cardid'].nunique():,}")
-
-    # Get ZIP valid on July 4
-    log(f"\nFinding address_map ZIP valid on {JULY_DATE.date()}...")
-    tv_july = tv[
-        (tv['valid_begin'] <= JULY_DATE) &
-        (tv['valid_end'] >= JULY_DATE)
-    ].copy()
+    # Load only address_map rows valid on July 4
+    log(f"Loading address_map (demographics_tv) rows valid on {JULY_DATE.date()}...")
+    tv_july = load_tv_july()
     log(f"  Rows valid on July 4: {len(tv_july):,}")
     log(f"  Unique cardids: {tv_july['cardid'].nunique():,}")
 
@@ -50,19 +75,31 @@ def main():
 
     # Load card info (Dec snapshot)
     log("\nLoading card table (Dec snapshot)...")
-    card_info = pd.read_parquet(CARD_INFO_PATH)
+    # Sniff the ZIP column from the schema, then read only the two we need
+    card_cols = pq.ParquetFile(CARD_INFO_PATH).schema_arrow.names
     zip_col = next(
-        (c for c in ['zip', 'ZIP', 'zip3', 'ZIP3'] if c in card_info.columns),
+        (c for c in ['zip', 'ZIP', 'zip3', 'ZIP3'] if c in card_cols),
         None
     )
-    card_info = card_info[['cardid', zip_col]].rename(columns={zip_col: 'zip_dec'})
+    card_info = pd.read_parquet(CARD_INFO_PATH, columns=['cardid', zip_col],
+                                engine='pyarrow')
+    card_info = card_info.rename(columns={zip_col: 'zip_dec'})
     card_info['zip_dec'] = card_info['zip_dec'].astype(str)
 
     # Load changers for July ZIP
     log("Loading changers...")
-    changers = pd.read_parquet(CHANGERS_PATH)[['cardid', 'zip_jul']]
+    changers = pd.read_parquet(CHANGERS_PATH, columns=['cardid', 'zip_jul'],
+                               engine='pyarrow')
     changers['zip_jul'] = changers['zip_jul'].astype(str)
 
+    # Categorical cardid with one shared category set, so the merges hash
+    # int codes rather than strings
+    cats = (pd.Index(tv_july['cardid'].unique())
+            .union(card_info['cardid'].unique())
+            .union(changers['cardid'].unique()))
+    for df in (tv_july, card_info, changers):
+        df['cardid'] = pd.Categorical(df['cardid'], categories=cats)
+
     # Merge and compute July ZIP
     merged = tv_july.merge(card_info, on='cardid', how='inner')
     merged = merged.merge(changers, on='cardid', how='left')
@@ -82,9 +119,14 @@ def main():
     mismatches = merged[~merged['match']]
     if len(mismatches) > 0:
         log(f"\nMismatches: {len(mismatches):,}")
-        for _, r in mismatches.head(10).iterrows():
-            log(f"  addr_map={r['zip_addr_map']} card={r['zip_card_jul']}")
-
+        log("\n".join(
+            f"  addr_map={r.zip_addr_map} card={r.zip_card_jul}"
+            for r in mismatches.head(10).itertuples(index=False)
+        ))
+
+    # cardid back to plain strings, as readers expect; the shared categorical
+    # would write a dictionary of every card_info cardid into the file
+    merged['cardid'] = merged['cardid'].astype(str)
     merged.to_parquet(f'{CEDGE_DATA}/address_map_july_validation.parquet')
     log("\nDone.")
 
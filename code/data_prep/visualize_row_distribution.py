@@ -10,11 +10,12 @@ Visualize address_map row distribution:
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-import random
+from tv_cache import read_tv
 
 CEDGE_DATA = '/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data'
 DROPBOX_OUT = '/Users/jeffreyohl/Dropbox/LLM_PassThrough/output'  # Root, not sample-specific
 TV_PATH = f'{CEDGE_DATA}/chatgpt_demographics_tv.parquet'
+TV_COLUMNS = ['cardid', 'zip', 'valid_begin', 'valid_end']
 
 
 def get_months():
@@ -22,32 +23,48 @@ def get_months():
     return pd.date_range('2022-01-01', '2025-07-01', freq='MS')
 
 
-def compute_monthly_modal(rows):
-    """Compute monthly modal ZIP3 for one cardid."""
-    months = get_months()
-    results = []
-
-    for m in months:
-        m_end = m + pd.offsets.MonthEnd(1)
-        days_per_zip = {}
-
-        for _, r in rows.iterrows():
-            if r['valid_begin'] <= m_end and r['valid_end'] >= m:
-                start = max(r['valid_begin'], m)
-                end = min(r['valid_end'], m_end)
-                days = (end - start).days + 1
-                z = str(r['zip'])
-                days_per_zip[z] = days_per_zip.get(z, 0) + days
+MONTHS = get_months()
+MONTH_ENDS = MONTHS + pd.offsets.MonthEnd(1)
 
-        if days_per_zip:
-            modal = max(days_per_zip, key=days_per_zip.get)
-            results.append({
-                'month': m,
-                'month_end': m_end,
-                'zip3': modal
-            })
 
-    return pd.DataFrame(results)
+def compute_monthly_modal(rows):
+    """Compute monthly modal ZIP3 per cardid, in one pass over all rows.
+
+    rows: address_map rows (any number of cardids), sorted by valid_begin.
+    Returns cardid, month, month_end, zip3.
+    """
+    cardid = rows['cardid'].to_numpy()
+    zips = rows['zip'].astype(str).to_numpy()
+    begin = rows['valid_begin'].to_numpy(dtype='datetime64[ns]')
+    end = rows['valid_end'].to_numpy(dtype='datetime64[ns]')
+
+    # Long (cardid, month, zip, days) table: one vectorized pass per month
+    parts = []
+    for i, (m, m_end) in enumerate(zip(MONTHS.to_numpy(), MONTH_ENDS.to_numpy())):
+        start = np.maximum(begin, m)
+        stop = np.minimum(end, m_end)
+        keep = stop >= start
+        parts.append(pd.DataFrame({
+            'cardid': cardid[keep],
+            'month': i,
+            'zip': zips[keep],
+            'days': (stop - start)[keep].astype('timedelta64[D]').astype(np.int64) + 1,
+        }))
+    long = pd.concat(parts, ignore_index=True)
+
+    # sort=False plus a stable sort keep first-seen ZIP order, so ties go to
+    # the earlier row
+    totals = long.groupby(['cardid', 'month', 'zip'], sort=False)['days'].sum().reset_index()
+    modal = (totals.sort_values('days', ascending=False, kind='stable')
+             .drop_duplicates(['cardid', 'month'])
+             .sort_values(['cardid', 'month']))
+    month_idx = modal['month'].to_numpy()
+    return pd.DataFrame({
+        'cardid': modal['cardid'].to_numpy(),
+        'month': MONTHS[month_idx],
+        'month_end': MONTH_ENDS[month_idx],
+        'zip3': modal['zip'].to_numpy(),
+    })
 
 
 def plot_cdf(counts, out_path):
@@ -76,7 +93,11 @@ def plot_cdf(counts, out_path):
 
     # Right: Histogram (log scale)
     bins = [1, 2, 3, 4, 5, 10, 20, 50, 100, 300]
-    hist, edges = np.histogram(counts.values, bins=bins)
+    # Bucket by searching the already-sorted counts; the last edge is
+    # inclusive, as in np.histogram
+    idx = np.searchsorted(sorted_counts, bins, side='left')
+    idx[-1] = np.searchsorted(sorted_counts, bins[-1], side='right')
+    hist = np.diff(idx)
 
     ax2.bar(range(len(hist)), hist, color='steelblue', edgecolor='black')
     ax2.set_xticks(range(len(hist)))
@@ -97,43 +118,42 @@ def plot_cdf(counts, out_path):
     plt.close()
 
 
-def plot_raw_and_coarsened(cardid, tv, ax_raw, ax_coarse, title, colors):
-    """Plot raw timeline (top) and coarsened monthly modal (bottom)."""
-    rows = tv[tv['cardid'] == cardid].sort_values('valid_begin')
+def plot_raw_and_coarsened(cardid, by_card, modal, ax_raw, ax_coarse, title, colors):
+    """Plot raw timeline (top) and coarsened monthly modal (bottom).
+
+    by_card: tv sorted by valid_begin, grouped by cardid.
+    modal: compute_monthly_modal output covering this cardid.
+    """
+    rows = by_card.get_group(cardid)
 
     zips = rows['zip'].astype(str).unique()
     zip_colors = {z: colors[i % len(colors)] for i, z in enumerate(zips)}
 
-    # RAW: plot each address_map row
-    for _, row in rows.iterrows():
-        z = str(row['zip'])
-        width = (row['valid_end'] - row['valid_begin']).days
-        ax_raw.barh(
-            y=0,
-            width=width,
-            left=row['valid_begin'],
-            height=0.5,
-            color=zip_colors[z],
-            edgecolor='black',
-            linewidth=0.3
-        )
-
-    # COARSENED: compute monthly modal and plot
-    monthly = compute_monthly_modal(rows)
-    for _, row in monthly.iterrows():
-        z = row['zip3']
+    # RAW: one bar per address_map row, drawn in a single call
+    ax_raw.barh(
+        y=0,
+        width=(rows['valid_end'] - rows['valid_begin']).dt.days.to_numpy(),
+        left=rows['valid_begin'].to_numpy(),
+        height=0.5,
+        color=[zip_colors[z] for z in rows['zip'].astype(str)],
+        edgecolor='black',
+        linewidth=0.3
+    )
+
+    # COARSENED: monthly modal
+    monthly = modal[modal['cardid'] == cardid]
+    for z in monthly['zip3']:
         if z not in zip_colors:
             zip_colors[z] = colors[len(zip_colors) % len(colors)]
-        width = (row['month_end'] - row['month']).days
-        ax_coarse.barh(
-            y=0,
-            width=width,
-            left=row['month'],
-            height=0.5,
-            color=zip_colors[z],
-            edgecolor='black',
-            linewidth=0.3
-        )
+    ax_coarse.barh(
+        y=0,
+        width=(monthly['month_end'] - monthly['month']).dt.days.to_numpy(),
+        left=monthly['month'].to_numpy(),
+        height=0.5,
+        color=[zip_colors[z] for z in monthly['zip3']],
+        edgecolor='black',
+        linewidth=0.3
+    )
 
     # Treatment line on both
     for ax in [ax_raw, ax_coarse]:
@@ -156,11 +176,16 @@ def plot_raw_and_coarsened(cardid, tv, ax_raw, ax_coarse, title, colors):
 
 def main():
     print("Loading address_map...")
-    tv = pd.read_parquet(TV_PATH)
-    tv['valid_begin'] = pd.to_datetime(tv['valid_begin'])
-    tv['valid_end'] = pd.to_datetime(tv['valid_end'])
-
-    counts = tv.groupby('cardid').size()
+    tv = read_tv(TV_PATH, TV_COLUMNS)
+    # Typed already if normalize_tv_dates.py has been run; parse only if not
+    for col in ['valid_begin', 'valid_end']:
+        if not pd.api.types.is_datetime64_any_dtype(tv[col]):
+            tv[col] = pd.to_datetime(tv[col])
+    tv['cardid'] = tv['cardid'].astype('category')
+
+    # One grouping, sorted once; examples look up their rows from it
+    by_card = tv.sort_values('valid_begin').groupby('cardid', sort=False, observed=True)
+    counts = by_card.size().sort_index()  # sorted, so seeded samples are stable
     print(f"Total cardids: {len(counts):,}")
     print(f"  1 row: {(counts == 1).sum():,} ({(counts == 1).mean()*100:.1f}%)")
     print(f"  2 rows: {(counts == 2).sum():,} ({(counts == 2).mean()*100:.1f}%)")
@@ -173,35 +198,42 @@ def main():
     plot_cdf(counts, f'{DROPBOX_OUT}/address_row_cdf.png')
 
     # 2. Example timelines with raw vs coarsened
-    random.seed(42)
+    rng = np.random.default_rng(42)
     colors = plt.cm.Set2.colors
 
-    # Get examples
-    two_row = random.sample(list(counts[counts == 2].index), 3)
-    mid_row = random.sample(list(counts[(counts >= 5) & (counts <= 10)].index), 3)
-    heavy = random.sample(list(counts[counts >= 50].index), 2)
+    # Get examples, sampling straight from the index array
+    cardids = counts.index.to_numpy()
+    n_rows = counts.to_numpy()
+    two_row = rng.choice(cardids[n_rows == 2], 3, replace=False).tolist()
+    mid_row = rng.choice(cardids[(n_rows >= 5) & (n_rows <= 10)], 3, replace=False).tolist()
+    heavy = rng.choice(cardids[n_rows >= 50], 2, replace=False).tolist()
     max_cardid = counts.idxmax()
+    examples_heavy = heavy + [max_cardid]
+
+    # Monthly modal for every example cardid in one pass
+    example_rows = pd.concat([by_card.get_group(c)
+                              for c in two_row + mid_row + examples_heavy])
+    modal = compute_monthly_modal(example_rows)
 
     # 3 rows of examples, each with 3 cardids, each cardid gets 2 rows (raw + coarse)
     fig, axes = plt.subplots(6, 3, figsize=(14, 10))
 
     # Row 0-1: 2-row examples
     for i, cardid in enumerate(two_row):
-        plot_raw_and_coarsened(cardid, tv, axes[0, i], axes[1, i],
+        plot_raw_and_coarsened(cardid, by_card, modal, axes[0, i], axes[1, i],
                                 f"2-row: {cardid[:10]}...", colors)
 
     # Row 2-3: 5-10 row examples
     for i, cardid in enumerate(mid_row):
         n = counts[cardid]
-        plot_raw_and_coarsened(cardid, tv, axes[2, i], axes[3, i],
+        plot_raw_and_coarsened(cardid, by_card, modal, axes[2, i], axes[3, i],
                                 f"{n}-row: {cardid[:10]}...", colors)
 
     # Row 4-5: Heavy bouncers + max
-    examples_heavy = heavy + [max_cardid]
     for i, cardid in enumerate(examples_heavy):
         n = counts[cardid]
         label = "MAX" if cardid == max_cardid else f"{n}-row"
-        plot_raw_and_coarsened(cardid, tv, axes[4, i], axes[5, i],
+        plot_raw_and_coarsened(cardid, by_card, modal, axes[4, i], axes[5, i],
                                 f"{label}: {cardid[:10]}...", colors)
 
     # Labels
@@ -9,7 +9,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from config import log, get_output_dir, get_filter_title
-from load_data import load_with_zip3
+from load_data import load_with_zip3, month_code, month_start
 
 # Key events
 EVENTS = {
@@ -26,29 +26,39 @@ FULL_PASSTHROUGH_11PCT = 22.20  # $20 * 1.11
 END_DATE = '2025-12-01'  # Include 11% period for context
 
 
-def main():
-    trans = load_with_zip3()
-
-    # Filter to Chicago (zip3 = 606)
-    chicago = trans[trans['zip3'] == '606'].copy()
+def main(trans=None):
+    # Chicago only (zip3 = 606), filtered at read time unless a loaded
+    # sample is passed in
+    if trans is None:
+        chicago = load_with_zip3(columns=['cardid', 'trans_date', 'trans_amount'],
+                                 zip3_filter='606')
+    else:
+        chicago = trans[trans['zip3'] == '606']
     log(f"Chicago (606xx Zip codes): {len(chicago):,} transactions")
 
     # Filter to date range
-    chicago = chicago[chicago['trans_date'] < END_DATE].copy()
-    chicago['month'] = chicago['trans_date'].dt.to_period('M')
+    chicago = chicago[chicago['trans_date'] < END_DATE]
+    # Int64 month code as the groupby key, converted to month-start dates after
+    # aggregating; passed as a standalone key rather than added as a column,
+    # so the slice isn't copied
+    month = pd.Series(month_code(chicago['trans_date']), index=chicago.index, name='month')
 
     log(f"Date range: {chicago['trans_date'].min().date()} to {chicago['trans_date'].max().date()}")
 
     # Monthly aggregation
-    monthly = chicago.groupby('month').agg(
+    by_month = chicago.groupby(month)
+    monthly = by_month.agg(
         transactions=('trans_amount', 'count'),
         total_spend=('trans_amount', 'sum'),
         unique_users=('cardid', 'nunique'),
-        median_transaction=('trans_amount', 'median'),
-        p25=('trans_amount', lambda x: x.quantile(0.25)),
-        p75=('trans_amount', lambda x: x.quantile(0.75)),
-    ).reset_index()
-    monthly['month_dt'] = monthly['month'].dt.to_timestamp()
+    )
+    # All three quantiles in one grouped call rather than per-group lambdas
+    quantiles = by_month['trans_amount'].quantile([0.25, 0.5, 0.75]).unstack()
+    quantiles.columns = ['p25', 'median_transaction', 'p75']
+    monthly = monthly.join(quantiles)[
+        ['transactions', 'total_spend', 'unique_users', 'median_transaction', 'p25', 'p75']
+    ].reset_index()
+    monthly['month'] = month_start(monthly['month'])
 
     print("\nMonthly summary:")
     print(monthly.to_string())
@@ -56,7 +66,7 @@ def main():
     # Create separate plots
     log("Creating plots...")
     out_dir = get_output_dir()
-    date_min, date_max = monthly['month_dt'].min(), monthly['month_dt'].max()
+    date_min, date_max = monthly['month'].min(), monthly['month'].max()
 
     def add_event_lines(ax):
         for event, date in EVENTS.items():
@@ -67,7 +77,7 @@ def main():
 
     # Figure 1: Transaction count
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(monthly['month_dt'], monthly['transactions'], marker='o', linewidth=2)
+    ax.plot(monthly['month'], monthly['transactions'], marker='o', linewidth=2)
     ax.set_ylabel('Transaction Count')
     ax.set_title('Chicago (606xx Zip codes) ChatGPT: Monthly Transactions')
     ax.set_xlim(date_min, date_max)
@@ -81,7 +91,7 @@ def main():
 
     # Figure 2: Total spend
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(monthly['month_dt'], monthly['total_spend'] / 1e3, marker='o', linewidth=2, color='green')
+    ax.plot(monthly['month'], monthly['total_spend'] / 1e3, marker='o', linewidth=2, color='green')
     ax.set_ylabel('Total Spend ($K)')
     ax.set_title('Chicago (606xx Zip codes) ChatGPT: Monthly Total Spend')
     ax.set_xlim(date_min, date_max)
@@ -95,7 +105,7 @@ def main():
 
     # Figure 3: Unique users
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(monthly['month_dt'], monthly['unique_users'], marker='o', linewidth=2, color='purple')
+    ax.plot(monthly['month'], monthly['unique_users'], marker='o', linewidth=2, color='purple')
     ax.set_ylabel('Unique Users')
     ax.set_title('Chicago (606xx Zip codes) ChatGPT: Monthly Unique Users')
     ax.set_xlim(date_min, date_max)
@@ -109,8 +119,8 @@ def main():
 
     # Figure 4: Median transaction with pass-through lines
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(monthly['month_dt'], monthly['median_transaction'], marker='o', linewidth=2, color='orange')
-    ax.fill_between(monthly['month_dt'], monthly['p25'], monthly['p75'], alpha=0.2, color='orange', label='IQR')
+    ax.plot(monthly['month'], monthly['median_transaction'], marker='o', linewidth=2, color='orange')
+    ax.fill_between(monthly['month'], monthly['p25'], monthly['p75'], alpha=0.2, color='orange', label='IQR')
 
     # Base price and full pass-through lines
     ax.axhline(BASE_PRICE, color='gray', linestyle='-', alpha=0.5, label=f'${BASE_PRICE:.0f} (no tax)')
@@ -148,7 +158,7 @@ def main():
     print()
 
     # 9% tax period
-    mask = monthly['month_dt'] >= '2023-10-01'
+    mask = monthly['month'] >= '2023-10-01'
     subset = monthly[mask]
     if len(subset) > 0:
         med = subset['median_transaction'].median()
@@ -6,17 +6,17 @@ Uses shared data loading from load_chatgpt_data.py.
 
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+import pyarrow.dataset as ds
 from pathlib import Path
 from config import log, get_output_dir, get_filter_title, get_outcome_column
-from load_data import load_with_zip3
+from load_data import load_with_zip3, month_code, month_start
 
 TREATED_ZIP = '606'
 START_DATE = '2023-02-01'
 END_DATE = '2024-12-01'  # Exclude ChatGPT Pro period
+SIZE_END_DATE = '2023-07-01'  # Controls are size-matched on Feb-Jun 2023
 SIZE_WINDOW = 0.5
 
 EVENTS = {
@@ -25,13 +25,21 @@ EVENTS = {
 }
 
 
-def main():
-    trans = load_with_zip3()
+def date_window(start, end):
+    """Arrow scan predicate for start <= trans_date < end."""
+    return ((ds.field('trans_date') >= pd.Timestamp(start))
+            & (ds.field('trans_date') < pd.Timestamp(end)))
 
-    # Select size-matched controls
+
+def main(trans=None):
+    # Select size-matched controls. Standalone, this needs only the zip3
+    # column of the Feb-Jun 2023 rows, not the full sample.
     log("Selecting size-matched controls...")
-    early = trans[(trans['trans_date'] >= START_DATE) & (trans['trans_date'] < '2023-07-01')]
-    counts = early.groupby('zip3').size().reset_index(name='n_trans')
+    if trans is None:
+        early = load_with_zip3(columns=['zip3'], row_filter=date_window(START_DATE, SIZE_END_DATE))
+    else:
+        early = trans[(trans['trans_date'] >= START_DATE) & (trans['trans_date'] < SIZE_END_DATE)]
+    counts = early.groupby('zip3', observed=True).size().reset_index(name='n_trans')
 
     chicago_size = counts[counts['zip3'] == TREATED_ZIP]['n_trans'].values[0]
     lower = chicago_size * (1 - SIZE_WINDOW)
@@ -39,45 +47,65 @@ def main():
 
     similar = counts[(counts['n_trans'] >= lower) & (counts['n_trans'] <= upper)]
     similar = similar[similar['zip3'] != TREATED_ZIP]
-    similar = similar[similar['zip3'].str.match(r'^\d{3}$')]
+    zips = similar['zip3'].astype(str)
+    similar = similar[(zips.str.len() == 3) & zips.str.isdigit()]
 
-    control_zips = similar['zip3'].tolist()
+    control_zips = similar['zip3'].astype(str).tolist()
     log(f"Chicago size: {chicago_size}, Controls: {len(control_zips)}")
 
-    # Filter to relevant ZIPs and date range
+    # Filter to relevant ZIPs and date range. Standalone, both filters run in
+    # the cache scan, so only Chicago and its controls are read into pandas.
     all_zips = [TREATED_ZIP] + control_zips
-    trans = trans[trans['zip3'].isin(all_zips)].copy()
-    trans = trans[(trans['trans_date'] >= START_DATE) & (trans['trans_date'] < END_DATE)].copy()
-    trans['month'] = trans['trans_date'].dt.to_period('M')
-
-    # Monthly aggregation
+    if trans is None:
+        trans = load_with_zip3(
+            columns=['trans_date', 'trans_amount'],
+            row_filter=date_window(START_DATE, END_DATE) & ds.field('zip3').isin(all_zips))
+    else:
+        mask = (trans['zip3'].isin(all_zips)
+                & (trans['trans_date'] >= START_DATE) & (trans['trans_date'] < END_DATE))
+        trans = trans.loc[mask]
+
+    # Monthly aggregation straight into a month x ZIP3 array: int month and
+    # zip3 codes, one bincount per outcome (count/sum skip NaN amounts)
     outcome_col = get_outcome_column()
-    monthly = trans.groupby(['zip3', 'month']).agg(
-        n_transactions=('trans_amount', 'count'),
-        total_spend=('trans_amount', 'sum')
-    ).reset_index()
-    monthly['month_dt'] = monthly['month'].dt.to_timestamp()
-    monthly['log_y'] = np.log(monthly[outcome_col])
-
-    # Pivot for plotting
-    pivot = monthly.pivot(index='month_dt', columns='zip3', values='log_y')
-    pivot['control_mean'] = pivot[control_zips].mean(axis=1)
+    amount = trans['trans_amount'].to_numpy()
+    has_amount = ~np.isnan(amount)
+    month_idx, months = pd.factorize(month_code(trans['trans_date']), sort=True)
+    zip_idx = pd.Index(all_zips).get_indexer(trans['zip3'])
+    cell = (month_idx * len(all_zips) + zip_idx)[has_amount]
+    shape = (len(months), len(all_zips))
+    n_transactions = np.bincount(cell, minlength=shape[0] * shape[1]).reshape(shape)
+    if outcome_col == 'total_spend':
+        y = np.bincount(cell, weights=amount[has_amount],
+                        minlength=shape[0] * shape[1]).reshape(shape)
+    else:
+        y = n_transactions.astype(float)
+    # Empty cells stay missing, as they were in the pivot
+    log_y = np.full(shape, np.nan)
+    np.log(y, out=log_y, where=n_transactions > 0)
+
+    month_dt = pd.DatetimeIndex(month_start(months))
+    treated_y = log_y[:, 0]  # all_zips[0] is TREATED_ZIP
+    control_mean = np.nanmean(log_y[:, 1:], axis=1)
 
     # Plot
     log("Creating plot...")
-    fig, ax = plt.subplots(figsize=(12, 6))
+    # Plain Figure, not pyplot: nothing is registered globally, so the figure
+    # is freed when main returns (run_reports.py runs several reports in one process)
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
 
-    ax.plot(pivot.index, pivot[TREATED_ZIP], marker='o', linewidth=2,
+    ax.plot(month_dt, treated_y, marker='o', linewidth=2,
             color='blue', label='Chicago (606xx Zip codes)')
-    ax.plot(pivot.index, pivot['control_mean'], marker='s', linewidth=2,
+    ax.plot(month_dt, control_mean, marker='s', linewidth=2,
             color='gray', linestyle='--', label=f'Control mean ({len(control_zips)} ZIP3s)')
 
     # Shade treatment period
-    ax.axvspan(pd.to_datetime('2023-10-01'), pivot.index.max(), alpha=0.15, color='red')
+    ax.axvspan(pd.to_datetime('2023-10-01'), month_dt.max(), alpha=0.15, color='red')
 
     for event, date in EVENTS.items():
         event_dt = pd.to_datetime(date)
-        if pivot.index.min() <= event_dt <= pivot.index.max():
+        if month_dt.min() <= event_dt <= month_dt.max():
             ax.axvline(event_dt, color='red', linestyle='--', alpha=0.7)
             ax.text(event_dt, ax.get_ylim()[1], event, rotation=90, va='top', fontsize=9, color='red')
 
@@ -92,9 +120,9 @@ def main():
     ax.text(0.02, 0.02, note, transform=ax.transAxes, fontsize=8,
             verticalalignment='bottom', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
-    plt.tight_layout()
+    fig.tight_layout()
     out_dir = get_output_dir()
-    plt.savefig(out_dir / "chicago_raw_counts.png", dpi=150, bbox_inches='tight')
+    fig.savefig(out_dir / "chicago_raw_counts.png", dpi=150)
     log(f"Saved: {out_dir / 'chicago_raw_counts.png'}")
 
 
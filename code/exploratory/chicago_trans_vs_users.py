@@ -3,27 +3,29 @@
 
 import sys
 sys.path.insert(0, '/Users/jeffreyohl/Documents/GitHub/brainstorming')
-from config import get_output_dir
-from load_data import load_with_zip3
+from config import EXPLORATORY_DPI, get_output_dir
+from load_data import load_with_zip3, month_code, month_start
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
-# Load data
-trans = load_with_zip3()
-
-# Filter to Chicago
-chicago = trans[trans['zip3'] == '606'].copy()
-chicago['month'] = chicago['trans_date'].dt.to_period('M')
+# Load Chicago only (filter applied at read time)
+chicago = load_with_zip3(columns=['cardid', 'trans_date'], zip3_filter='606')
 
 # Aggregate by month
-monthly = chicago.groupby('month').agg(
-    n_transactions=('cardid', 'count'),
-    n_users=('cardid', 'nunique')
-).reset_index()
-monthly['month'] = monthly['month'].dt.to_timestamp()
+# Hash month and cardid once each; both counts come from the int codes
+month_idx, months = pd.factorize(month_code(chicago['trans_date']), sort=True)
+card_code, cards = pd.factorize(chicago['cardid'])
+n_trans = np.bincount(month_idx, minlength=len(months))
+# Unique users = distinct (month, cardid) pairs per month. A missing cardid
+# has code -1, which would land in the previous month's bucket: drop it.
+has_card = card_code >= 0
+pairs = np.unique(month_idx[has_card].astype(np.int64) * len(cards) + card_code[has_card])
+n_users = np.bincount(pairs // len(cards), minlength=len(months))
+monthly = pd.DataFrame({'month': month_start(months), 'n_transactions': n_trans, 'n_users': n_users})
 
 # Plot
-fig, ax1 = plt.subplots(figsize=(10, 6))
+fig, ax1 = plt.subplots(figsize=(10, 6), constrained_layout=True)
 
 color1 = 'tab:blue'
 ax1.set_xlabel('Month')
@@ -51,13 +53,11 @@ lines1, labels1 = ax1.get_legend_handles_labels()
 lines2, labels2 = ax2.get_legend_handles_labels()
 ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
 
-plt.tight_layout()
-
 # Save
 out_dir = get_output_dir() / 'exploratory'
 out_dir.mkdir(parents=True, exist_ok=True)
 out_path = out_dir / 'chicago_trans_vs_users.png'
-plt.savefig(out_path, dpi=150)
+fig.savefig(out_path, dpi=EXPLORATORY_DPI)
 print(f"Saved: {out_path}")
 
 # Print summary stats
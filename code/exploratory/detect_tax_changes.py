@@ -51,30 +51,47 @@ MIN_TRANS_PER_PERIOD = 50
 TAX_THRESHOLD_PCT = 5.0
 
 
-def main():
-    log("Loading transaction data with zip3...")
-    trans = load_with_zip3()
-
-    # Define periods
-    mar_2023 = (trans['trans_date'] >= '2023-03-01') & \
-               (trans['trans_date'] < '2023-04-01')
-    nov_2024 = (trans['trans_date'] >= '2024-11-01') & \
-               (trans['trans_date'] < '2024-12-01')
+def main(trans=None):
+    if trans is None:
+        log("Loading transaction data with zip3...")
+        trans = load_with_zip3(columns=['zip3', 'trans_date', 'trans_amount'])
+
+    # Bucket dates into periods: 0 = Mar 2023, 1 = Nov 2024, -1 = neither
+    trans_date = trans['trans_date']
+    mar_2023 = (trans_date >= '2023-03-01') & (trans_date < '2023-04-01')
+    nov_2024 = (trans_date >= '2024-11-01') & (trans_date < '2024-12-01')
+    period = np.where(mar_2023, 0, np.where(nov_2024, 1, -1))
+    keep = period >= 0
 
     log("Computing median prices by ZIP3...")
 
-    # March 2023 medians
-    mar = trans[mar_2023].groupby('zip3')['trans_amount'].agg(
-        ['median', 'count']
-    ).rename(columns={'median': 'med_mar23', 'count': 'n_mar23'})
-
-    # November 2024 medians
-    nov = trans[nov_2024].groupby('zip3')['trans_amount'].agg(
-        ['median', 'count']
-    ).rename(columns={'median': 'med_nov24', 'count': 'n_nov24'})
-
-    # Merge
-    df = mar.join(nov, how='inner')
+    # One sort by (zip3, period, amount): each group is then a sorted run and
+    # its median is read off the middle, as in median_price_by_zip3
+    codes = trans['zip3'].cat.codes.to_numpy()[keep].astype(np.int64)
+    amount = trans['trans_amount'].to_numpy(dtype=float)[keep]
+    valid = (codes >= 0) & ~np.isnan(amount)
+    group = 2 * codes[valid] + period[keep][valid]
+    amount = amount[valid]
+    order = np.lexsort((amount, group))
+    group, amount = group[order], amount[order]
+    groups, starts, n = np.unique(group, return_index=True, return_counts=True)
+    # Average the two middle values for even counts, matching pandas
+    median = (amount[starts + (n - 1) // 2] + amount[starts + n // 2]) / 2
+    stats = pd.DataFrame({'median': median, 'count': n},
+                         index=pd.MultiIndex.from_arrays(
+                             [trans['zip3'].cat.categories[groups // 2], groups % 2],
+                             names=['zip3', None])).unstack()
+    # A period with no rows has no columns after unstack; add them as NaN
+    stats = stats.reindex(columns=pd.MultiIndex.from_product([['median', 'count'], [0, 1]]))
+
+    # Keep ZIP3s with data in both periods
+    df = pd.DataFrame({
+        'med_mar23': stats[('median', 0)],
+        'n_mar23': stats[('count', 0)],
+        'med_nov24': stats[('median', 1)],
+        'n_nov24': stats[('count', 1)],
+    }).dropna()
+    df[['n_mar23', 'n_nov24']] = df[['n_mar23', 'n_nov24']].astype(int)
     log(f"ZIP3s with data in both periods: {len(df)}")
 
     # Filter by minimum transactions
@@ -82,11 +99,13 @@ def main():
             (df['n_nov24'] >= MIN_TRANS_PER_PERIOD)].copy()
     log(f"ZIP3s with >= {MIN_TRANS_PER_PERIOD} trans in each period: {len(df)}")
 
-    # Compute percent change
-    df['pct_change'] = 100 * (df['med_nov24'] - df['med_mar23']) / df['med_mar23']
+    # Compute percent change on the raw arrays
+    base = df['med_mar23'].to_numpy()
+    pct = (df['med_nov24'].to_numpy() - base) * (100.0 / base)
+    df['pct_change'] = pct
 
     # Sort by percent change (descending)
-    df = df.sort_values('pct_change', ascending=False).reset_index()
+    df = df.iloc[np.argsort(-pct, kind='stable')].reset_index()
 
     # Print summary
     log("\n=== TOP 20 ZIP3s BY PRICE INCREASE ===")
@@ -119,45 +138,27 @@ def create_funnel_plot(df):
     y_pos = np.arange(n)
 
     # Color by magnitude
-    colors = []
-    for pct in df['pct_change']:
-        if pct >= TAX_THRESHOLD_PCT:
-            colors.append('red')
-        elif pct >= 2:
-            colors.append('orange')
-        elif pct <= -TAX_THRESHOLD_PCT:
-            colors.append('blue')
-        elif pct <= -2:
-            colors.append('lightblue')
-        else:
-            colors.append('gray')
-
-    bars = ax.barh(y_pos, df['pct_change'], color=colors, alpha=0.7)
-
-    # Get top 3 and bottom 3 indices
-    top3_idx = set(range(3))
-    bot3_idx = set(range(n - 3, n))
-
-    # Find Chicago's index
-    chicago_idx = None
-    for i, zip3 in enumerate(df['zip3']):
-        if zip3 == '606':
-            chicago_idx = i
-            break
-
-    # Indices to label
-    label_idx = top3_idx | bot3_idx
-    if chicago_idx is not None and chicago_idx not in label_idx:
-        label_idx.add(chicago_idx)
-
-    # Add labels with actual names for top 3, bottom 3, and Chicago
-    for i, (zip3, pct) in enumerate(zip(df['zip3'], df['pct_change'])):
-        if i in label_idx:
-            name = ZIP3_NAMES.get(zip3, zip3)
-            label_text = f"{zip3} ({name})"
-            offset = 0.3 if pct > 0 else -0.3
-            ax.text(pct + offset, i, label_text, va='center', fontsize=7,
-                    ha='left' if pct > 0 else 'right')
+    pct_change = df['pct_change'].to_numpy()
+    colors = np.select(
+        [pct_change >= TAX_THRESHOLD_PCT, pct_change >= 2,
+         pct_change <= -TAX_THRESHOLD_PCT, pct_change <= -2],
+        ['red', 'orange', 'blue', 'lightblue'],
+        default='gray'
+    )
+
+    bars = ax.barh(y_pos, pct_change, color=colors, alpha=0.7)
+
+    # Rows to label: top 3, bottom 3, and Chicago
+    label_mask = (y_pos < 3) | (y_pos >= n - 3) | (df['zip3'] == '606').to_numpy()
+
+    # Add labels with actual names, looping over the labeled rows only
+    for i in np.flatnonzero(label_mask):
+        zip3, pct = df['zip3'].iat[i], pct_change[i]
+        name = ZIP3_NAMES.get(zip3, zip3)
+        label_text = f"{zip3} ({name})"
+        offset = 0.3 if pct > 0 else -0.3
+        ax.text(pct + offset, i, label_text, va='center', fontsize=7,
+                ha='left' if pct > 0 else 'right')
 
     ax.axvline(0, color='black', linewidth=0.5)
     ax.axvline(TAX_THRESHOLD_PCT, color='red', linestyle='--',
@@ -187,8 +188,9 @@ def create_funnel_plot(df):
     # Top 30 (biggest increases)
     top30 = df.head(30)
     y_top = np.arange(len(top30))
-    colors_top = ['red' if p >= TAX_THRESHOLD_PCT else 'orange' if p >= 2
-                  else 'gray' for p in top30['pct_change']]
+    pct_top = top30['pct_change'].to_numpy()
+    colors_top = np.select([pct_top >= TAX_THRESHOLD_PCT, pct_top >= 2],
+                           ['red', 'orange'], default='gray')
     ax1.barh(y_top, top30['pct_change'], color=colors_top, alpha=0.7)
     ax1.set_yticks(y_top)
     ax1.set_yticklabels(top30['zip3'], fontsize=8)
@@ -201,8 +203,9 @@ def create_funnel_plot(df):
     # Bottom 30 (biggest decreases)
     bot30 = df.tail(30).iloc[::-1]  # Reverse for display
     y_bot = np.arange(len(bot30))
-    colors_bot = ['blue' if p <= -TAX_THRESHOLD_PCT else 'lightblue' if p <= -2
-                  else 'gray' for p in bot30['pct_change']]
+    pct_bot = bot30['pct_change'].to_numpy()
+    colors_bot = np.select([pct_bot <= -TAX_THRESHOLD_PCT, pct_bot <= -2],
+                           ['blue', 'lightblue'], default='gray')
     ax2.barh(y_bot, bot30['pct_change'], color=colors_bot, alpha=0.7)
     ax2.set_yticks(y_bot)
     ax2.set_yticklabels(bot30['zip3'], fontsize=8)
@@ -2,8 +2,13 @@
 """
 Plot median transaction price for any ZIP3.
 Use to check if high-RMSPE areas show tax-induced price jumps.
+
+Run:
+    python3 code/exploratory/median_price_by_zip3.py [--panel-only]
 """
 
+import argparse
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
@@ -12,8 +17,8 @@ import matplotlib.dates as mdates
 from pathlib import Path
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from config import log
-from load_data import load_with_zip3
+from config import EXPLORATORY_DPI, log
+from load_data import load_with_zip3, month_code, month_start
 
 OUT_DIR = Path('/Users/jeffreyohl/Dropbox/LLM_PassThrough/output/exploratory')
 OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -33,22 +38,43 @@ TOP_RMSPE_ZIP3S = {
 }
 
 
-def plot_median_price(trans, zip3, label, ax):
-    """Plot median price for a single ZIP3."""
-    subset = trans[trans['zip3'] == zip3].copy()
-    if len(subset) == 0:
+def monthly_price_stats(subset):
+    """Median, p25, p75 and count of trans_amount per month, from one sort.
+
+    Quantiles use linear interpolation, matching pandas' default.
+    """
+    month = month_code(subset['trans_date'])
+    amount = subset['trans_amount'].to_numpy(dtype=float)
+    valid = ~np.isnan(amount)
+    month, amount = month[valid], amount[valid]
+
+    # Sort by (month, amount); each month is then a sorted run
+    order = np.lexsort((amount, month))
+    month, amount = month[order], amount[order]
+    months, starts, n = np.unique(month, return_index=True, return_counts=True)
+
+    def quantile(q):
+        pos = starts + q * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        return amount[lo] + (amount[hi] - amount[lo]) * (pos - lo)
+
+    return pd.DataFrame({
+        'month_dt': month_start(months),
+        'median': quantile(0.5),
+        'p25': quantile(0.25),
+        'p75': quantile(0.75),
+        'n': n,
+    })
+
+
+def plot_median_price(monthly_by_zip3, zip3, ax):
+    """Plot median price for a single ZIP3 from its precomputed monthly stats."""
+    monthly = monthly_by_zip3.get(zip3)
+    if monthly is None:
         print(f"  No data for ZIP3 {zip3}")
         return None
 
-    subset['month'] = subset['trans_date'].dt.to_period('M')
-    monthly = subset.groupby('month').agg(
-        median=('trans_amount', 'median'),
-        p25=('trans_amount', lambda x: x.quantile(0.25)),
-        p75=('trans_amount', lambda x: x.quantile(0.75)),
-        n=('trans_amount', 'count'),
-    ).reset_index()
-    monthly['month_dt'] = monthly['month'].dt.to_timestamp()
-
     ax.plot(monthly['month_dt'], monthly['median'],
             marker='o', linewidth=2, markersize=4)
     ax.fill_between(monthly['month_dt'], monthly['p25'], monthly['p75'],
@@ -57,21 +83,42 @@ def plot_median_price(trans, zip3, label, ax):
     return monthly
 
 
-def main():
-    log("Loading transaction data...")
-    trans = load_with_zip3()
-    trans = trans[trans['trans_date'] < '2025-12-01'].copy()
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Plot median transaction price for the top RMSPE ZIP3s."
+    )
+    parser.add_argument(
+        "--panel-only",
+        action="store_true",
+        help="Only draw the 6-panel figure; skip the per-ZIP3 figures."
+    )
+    return parser.parse_args()
+
+
+def main(trans=None, panel_only=False):
+    if trans is None:
+        log("Loading transaction data...")
+        trans = load_with_zip3(columns=['zip3', 'trans_date', 'trans_amount'])
+    trans = trans[(trans['trans_date'] < '2025-12-01')
+                  & trans['zip3'].isin(list(TOP_RMSPE_ZIP3S))]
+
+    # Monthly stats per ZIP3, computed once and reused by both figures
+    monthly_by_zip3 = {
+        zip3: monthly_price_stats(group)
+        for zip3, group in trans.groupby('zip3', observed=True)
+    }
 
     # Create figure with subplots
     n_zip3s = len(TOP_RMSPE_ZIP3S)
-    fig, axes = plt.subplots(3, 2, figsize=(14, 12), sharex=True, sharey=True)
+    fig, axes = plt.subplots(3, 2, figsize=(14, 12), sharex=True, sharey=True,
+                             constrained_layout=True)
     axes = axes.flatten()
 
     for i, (zip3, label) in enumerate(TOP_RMSPE_ZIP3S.items()):
         ax = axes[i]
         log(f"Plotting ZIP3 {zip3} ({label})...")
 
-        monthly = plot_median_price(trans, zip3, label, ax)
+        monthly = plot_median_price(monthly_by_zip3, zip3, ax)
 
         if monthly is not None:
             # Reference lines
@@ -101,17 +148,20 @@ def main():
     fig.suptitle('Median Transaction Price: Top RMSPE Ratio ZIP3s\n'
                  '(Gray=$20 base, Blue=$21.80 full 9% pass-through, '
                  'Red=Oct 2023)', fontsize=11)
-    plt.tight_layout()
 
     outpath = OUT_DIR / 'median_price_top_rmspe_zip3s.png'
-    plt.savefig(outpath, dpi=150, bbox_inches='tight')
+    fig.savefig(outpath, dpi=EXPLORATORY_DPI, bbox_inches='tight')
     log(f"Saved: {outpath}")
     plt.close()
 
-    # Also create individual plots for each
+    if panel_only:
+        return
+
+    # Also create individual plots for each, reusing one figure
+    fig, ax = plt.subplots(figsize=(10, 6), constrained_layout=True)
     for zip3, label in TOP_RMSPE_ZIP3S.items():
-        fig, ax = plt.subplots(figsize=(10, 6))
-        monthly = plot_median_price(trans, zip3, label, ax)
+        ax.clear()
+        monthly = plot_median_price(monthly_by_zip3, zip3, ax)
 
         if monthly is not None:
             ax.axhline(BASE_PRICE, color='gray', linestyle='-',
@@ -131,12 +181,11 @@ def main():
             ax.legend(loc='upper left', fontsize=9)
             ax.grid(True, alpha=0.3)
 
-            plt.tight_layout()
-            plt.savefig(OUT_DIR / f'median_price_{zip3}.png',
-                        dpi=150, bbox_inches='tight')
-            plt.close()
+            fig.savefig(OUT_DIR / f'median_price_{zip3}.png',
+                        dpi=EXPLORATORY_DPI, bbox_inches='tight')
             log(f"Saved: median_price_{zip3}.png")
+    plt.close(fig)
 
 
 if __name__ == "__main__":
-    main()
+    main(panel_only=parse_args().panel_only)
@@ -5,11 +5,16 @@ National time series showing % of ChatGPT transactions by price bucket.
 
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from load_data import month_code, month_start
 
 DATA_DIR = Path("/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data")
 OUTPUT_DIR = Path(__file__).parent
@@ -27,47 +32,46 @@ def log(msg):
 
 def main():
     log("Loading transactions...")
-    dfs = []
-    for year in [2023, 2024, 2025]:
-        f = DATA_DIR / f"chatgpt_transactions_{year}.parquet"
-        if f.exists():
-            dfs.append(pd.read_parquet(f))
-    trans = pd.concat(dfs, ignore_index=True)
+    files = [DATA_DIR / f"chatgpt_transactions_{year}.parquet" for year in [2023, 2024, 2025]]
+    dataset = ds.dataset([str(f) for f in files if f.exists()], format='parquet')
+    # All year files decoded concurrently, only the columns used below
+    trans = dataset.to_table(columns=['service', 'trans_date', 'trans_amount'],
+                             use_threads=True,
+                             fragment_readahead=max(len(dataset.files), 1)).to_pandas()
     log(f"Total transactions: {len(trans):,}")
 
     # Filter to ChatGPT/OpenAI only
     trans = trans[trans['service'].str.lower().isin(['chatgpt', 'openai'])]
     log(f"ChatGPT/OpenAI: {len(trans):,}")
 
-    # Prep data
-    trans['trans_date'] = pd.to_datetime(trans['trans_date'])
-    trans['trans_amount'] = pd.to_numeric(trans['trans_amount'], errors='coerce')
-    trans['month'] = trans['trans_date'].dt.to_period('M')
-
-    # Define price buckets
-    def bucket(amt):
-        if pd.isna(amt):
-            return 'Other'
-        elif 20 <= amt <= 25:
-            return '$20-25 (Plus)'
-        elif 200 <= amt <= 250:
-            return '$200-250 (Pro)'
-        else:
-            return 'Other'
-
-    trans['bucket'] = trans['trans_amount'].apply(bucket)
-
-    # Monthly counts by bucket
-    monthly = trans.groupby(['month', 'bucket']).size().unstack(fill_value=0)
-    monthly['total'] = monthly.sum(axis=1)
-
-    # Compute percentages
-    for col in ['$20-25 (Plus)', '$200-250 (Pro)', 'Other']:
-        if col in monthly.columns:
-            monthly[f'{col} %'] = monthly[col] / monthly['total'] * 100
+    # Prep data; parse only if the parquet does not already store them typed
+    if not pd.api.types.is_datetime64_any_dtype(trans['trans_date']):
+        trans['trans_date'] = pd.to_datetime(trans['trans_date'])
+    if not pd.api.types.is_numeric_dtype(trans['trans_amount']):
+        trans['trans_amount'] = pd.to_numeric(trans['trans_amount'], errors='coerce')
+    # Int64 month code, not per-row Period objects; dates restored after grouping
+    trans['month'] = month_code(trans['trans_date'])
+
+    # Price buckets (NaN amounts fail both ranges and land in Other)
+    amt = trans['trans_amount'].to_numpy()
+    conds = [(amt >= 20) & (amt <= 25), (amt >= 200) & (amt <= 250)]
+    trans['bucket'] = pd.Categorical(
+        np.select(conds, ['$20-25 (Plus)', '$200-250 (Pro)'], default='Other'),
+        categories=['$20-25 (Plus)', '$200-250 (Pro)', 'Other'])
+
+    # Monthly counts by bucket (plain string columns so 'total' can be added)
+    monthly = trans.groupby(['month', 'bucket'], observed=True).size().unstack(fill_value=0)
+    monthly.columns = monthly.columns.astype(str)
+    total = monthly.sum(axis=1)
+
+    # Percentages for every observed bucket in one division
+    pct = monthly.div(total, axis=0).mul(100).add_suffix(' %')
+    monthly['total'] = total
+    monthly = pd.concat([monthly, pct], axis=1)
 
     monthly = monthly.reset_index()
-    monthly['month_dt'] = monthly['month'].dt.to_timestamp()
+    monthly['month'] = month_start(monthly['month'])
+    monthly['month_dt'] = monthly['month']
 
     print("\nMonthly breakdown:")
     print(monthly[['month', '$20-25 (Plus)', '$200-250 (Pro)', 'Other', 'total']].tail(12).to_string())
@@ -6,12 +6,14 @@ Example: python quick_zip_compare.py 606 077
 """
 
 import sys
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from config import get_exploratory_dir, get_log_outcome_column, get_outcome_label
+from config import EXPLORATORY_DPI, get_exploratory_dir, get_log_outcome_column, get_outcome_label
+from load_data import read_dta_cached
 
 if len(sys.argv) != 3:
     print("Usage: python quick_zip_compare.py ZIP1 ZIP2")
@@ -27,12 +29,14 @@ OUT = get_exploratory_dir()
 outcome_col = get_log_outcome_column()
 outcome_label = get_outcome_label()
 
-# Load data
-df = pd.read_stata(DATA)
+# Load data: memory-map only the columns this plot needs from the cached copy
+df = read_dta_cached(DATA, columns=['zip3', 'month_num', outcome_col])
 
-# Filter
-d1 = df[df['zip3'] == zip1].sort_values('month_num').reset_index()
-d2 = df[df['zip3'] == zip2].sort_values('month_num').reset_index()
+# Split by zip3 once; each lookup is then a dict hit
+groups = dict(list(df.groupby('zip3', sort=False, observed=True)))
+empty = df.iloc[:0]
+d1 = groups.get(zip1, empty).sort_values('month_num').reset_index()
+d2 = groups.get(zip2, empty).sort_values('month_num').reset_index()
 
 print(f"{zip1}: {len(d1)} months")
 print(f"{zip2}: {len(d2)} months")
@@ -41,14 +45,15 @@ if len(d1) == 0 or len(d2) == 0:
     print("ERROR: One or both zips not found in data")
     sys.exit(1)
 
-# Compute difference
-merged = d1[['month_num', outcome_col]].merge(
-    d2[['month_num', outcome_col]],
-    on='month_num', suffixes=('_1', '_2'))
-merged['diff'] = merged[f'{outcome_col}_1'] - merged[f'{outcome_col}_2']
+# Compute difference on the months both ZIP3s have (aligned by month_num)
+months = np.intersect1d(d1['month_num'].to_numpy(), d2['month_num'].to_numpy())
+s1 = pd.Series(d1[outcome_col].to_numpy(), index=d1['month_num'].to_numpy())
+s2 = pd.Series(d2[outcome_col].to_numpy(), index=d2['month_num'].to_numpy())
+diff = s1.reindex(months) - s2.reindex(months)
 
 # Plot
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), sharex=True,
+                               constrained_layout=True)
 
 # Panel 1: Levels
 ax1.plot(d1['month_num'], d1[outcome_col],
@@ -63,7 +68,7 @@ ax1.legend()
 ax1.grid(True, alpha=0.3)
 
 # Panel 2: Difference
-ax2.plot(merged['month_num'], merged['diff'],
+ax2.plot(diff.index, diff.to_numpy(),
          'g-o', linewidth=2, markersize=5)
 ax2.axvline(x=10, color='black', linestyle='--', alpha=0.7)
 ax2.axhline(y=0, color='gray', linestyle='-', alpha=0.5)
@@ -72,8 +77,7 @@ ax2.set_ylabel(f'Difference ({zip1} - {zip2})')
 ax2.set_title(f'{zip1} minus {zip2}')
 ax2.grid(True, alpha=0.3)
 
-plt.tight_layout()
 outfile = OUT / f'quick_{zip1}_vs_{zip2}.png'
-plt.savefig(outfile, dpi=150)
+fig.savefig(outfile, dpi=EXPLORATORY_DPI)
 print(f"Saved to {outfile}")
 plt.show()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Run several load_with_zip3 reports on one load of the transaction sample.
+
+Each report script still runs on its own; this runner loads the columns they
+need once and hands the same DataFrame to each report's main().
+
+Run:
+    python3 code/exploratory/run_reports.py                  # all reports
+    python3 code/exploratory/run_reports.py tax-changes chicago-vs-rest
+"""
+
+import argparse
+from pathlib import Path
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import log
+from load_data import load_with_zip3
+
+import chicago_chatgpt_analysis
+import chicago_raw_counts
+import detect_tax_changes
+import median_price_by_zip3
+import plot_chicago_vs_rest
+
+# Union of the columns the reports read
+COLUMNS = ['zip3', 'cardid', 'trans_date', 'trans_amount']
+
+REPORTS = {
+    'tax-changes': detect_tax_changes.main,
+    'median-by-zip3': median_price_by_zip3.main,
+    'chicago-vs-rest': plot_chicago_vs_rest.main,
+    'chicago-raw-counts': chicago_raw_counts.main,
+    'chicago-analysis': chicago_chatgpt_analysis.main,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run exploratory reports on one shared load_with_zip3 load."
+    )
+    parser.add_argument(
+        "reports",
+        nargs="*",
+        metavar="REPORT",
+        help=f"Reports to run (default: all). One of: {', '.join(REPORTS)}."
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown report(s): {', '.join(unknown)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    names = args.reports or list(REPORTS)
+
+    log("Loading transaction data with zip3...")
+    trans = load_with_zip3(columns=COLUMNS)
+
+    for name in names:
+        log(f"=== {name} ===")
+        REPORTS[name](trans)
+
+
+if __name__ == "__main__":
+    main()
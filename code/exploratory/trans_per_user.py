@@ -5,10 +5,8 @@ import sys
 sys.path.insert(0, '/Users/jeffreyohl/Documents/GitHub/brainstorming')
 from load_data import load_with_zip3
 
-trans = load_with_zip3()
-
-# Filter to zip3 606
-chicago = trans[trans['zip3'] == '606']
+# Load zip3 606 only (filter applied at read time)
+chicago = load_with_zip3(columns=['cardid'], zip3_filter='606')
 
 n_trans = len(chicago)
 n_users = chicago['cardid'].nunique()
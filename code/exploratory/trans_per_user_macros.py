@@ -3,12 +3,12 @@
 
 import sys
 sys.path.insert(0, '/Users/jeffreyohl/Documents/GitHub/brainstorming')
-from load_data import load_with_zip3
+from load_data import load_with_zip3, month_code
 from pathlib import Path
 
 # Load data
-trans = load_with_zip3()
-trans['month'] = trans['trans_date'].dt.to_period('M')
+trans = load_with_zip3(columns=['zip3', 'cardid', 'trans_date'])
+trans['month'] = month_code(trans['trans_date'])
 
 # Get sample end month
 end_month = trans['month'].max()
@@ -31,10 +31,7 @@ def calc_metrics(df, label):
     first_month.columns = ['cardid', 'first_month']
 
     # For each user: months from first_month to end_month (inclusive)
-    def months_since_first(first_m):
-        return (end_month - first_m).n + 1
-
-    first_month['post_first_months'] = first_month['first_month'].apply(months_since_first)
+    first_month['post_first_months'] = end_month - first_month['first_month'] + 1
     total_post_first_months = first_month['post_first_months'].sum()
     trans_per_post_first_month = n_trans / total_post_first_months
 
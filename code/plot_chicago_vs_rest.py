@@ -11,48 +11,51 @@ from pathlib import Path
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import get_exploratory_dir, log
-from load_data import load_with_zip3
+from config import EXPLORATORY_DPI, get_exploratory_dir, log
+from load_data import load_with_zip3, month_code, month_start
 
-def main():
+def main(trans=None):
     # Load data
-    trans = load_with_zip3()
+    if trans is None:
+        trans = load_with_zip3(columns=['zip3', 'cardid', 'trans_date'])
 
-    # Create year-month
-    trans['ym'] = trans['trans_date'].dt.to_period('M')
+    # Year-month as an int64 month code; kept as an array, not a new column
+    ym = month_code(trans['trans_date'])
 
     # Restrict to analysis window: March 2023 - November 2024
-    trans = trans[
-        (trans['ym'] >= pd.Period('2023-03', freq='M')) &
-        (trans['ym'] <= pd.Period('2024-11', freq='M'))
-    ]
-    log(f"After date filter (Mar 2023 - Nov 2024): {len(trans):,}")
-
-    # Chicago = ZIP3 606
-    chi_trans = trans[trans['zip3'] == '606']
-    rest_trans = trans[trans['zip3'] != '606']
-
-    # Aggregate: unique users per month
-    chicago = (
-        chi_trans
-        .groupby('ym')
-        .agg(n_users=('cardid', 'nunique'))
-        .reset_index()
-    )
-    chicago['date'] = chicago['ym'].dt.to_timestamp()
-    chicago['log_users'] = np.log(chicago['n_users'])
-
-    rest = (
-        rest_trans
-        .groupby('ym')
-        .agg(n_users=('cardid', 'nunique'))
-        .reset_index()
-    )
-    rest['date'] = rest['ym'].dt.to_timestamp()
-    rest['log_users'] = np.log(rest['n_users'])
+    first_ym, last_ym = month_code(pd.to_datetime(['2023-03-01', '2024-11-01']))
+    in_window = (ym >= first_ym) & (ym <= last_ym)
+    log(f"After date filter (Mar 2023 - Nov 2024): {in_window.sum():,}")
+
+    # Fused (series, month) key: series 0 = Chicago (ZIP3 606), 1 = rest
+    month_idx, months = pd.factorize(ym[in_window], sort=True)
+    rest_flag = (trans['zip3'] != '606').to_numpy()[in_window]
+    key = rest_flag * len(months) + month_idx
+    card_code, cards = pd.factorize(trans['cardid'])
+    card_code = card_code[in_window]
+
+    # Unique users per month = distinct (key, cardid) pairs per key; both
+    # series come from one pass over the int codes. A missing cardid has
+    # code -1, which would land in the previous key's bucket: drop it.
+    has_card = card_code >= 0
+    pairs = np.unique(key[has_card].astype(np.int64) * len(cards) + card_code[has_card])
+    n_users = np.bincount(pairs // len(cards), minlength=2 * len(months))
+    n_users = n_users.reshape(2, len(months))
+
+    def users_frame(counts):
+        present = counts > 0
+        return pd.DataFrame({
+            'ym': months[present],
+            'n_users': counts[present],
+            'date': month_start(months[present]),
+            'log_users': np.log(counts[present]),
+        })
+
+    chicago = users_frame(n_users[0])
+    rest = users_frame(n_users[1])
 
     # Plot with two y-axes (different scales)
-    fig, ax1 = plt.subplots(figsize=(10, 6))
+    fig, ax1 = plt.subplots(figsize=(10, 6), constrained_layout=True)
 
     ax1.plot(chicago['date'], chicago['log_users'],
              'k-', linewidth=2, label='Chicago')
@@ -82,12 +85,10 @@ def main():
     ax1.spines['top'].set_visible(False)
     ax2.spines['top'].set_visible(False)
 
-    plt.tight_layout()
-
     # Save to exploratory
     out_dir = get_exploratory_dir()
     out_path = out_dir / 'chicago_vs_rest_raw.png'
-    plt.savefig(out_path, dpi=150, bbox_inches='tight')
+    fig.savefig(out_path, dpi=EXPLORATORY_DPI, bbox_inches='tight')
     log(f"Saved: {out_path}")
 
     plt.close()
@@ -6,18 +6,19 @@ For each k, plots all synthetic control lines on one chart.
 
 import pandas as pd
 import numpy as np
-from scipy.optimize import minimize
 from itertools import combinations
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
 from config import log, get_output_dir, get_filter_title
-from load_data import load_with_zip3
+from load_data import load_with_zip3, month_code, month_start
 
 TREATED_ZIP = '606'
 START_DATE = '2023-03-01'
 TREATMENT_DATE = '2023-10-01'
+TREATMENT_TS = pd.Timestamp(TREATMENT_DATE)
 END_DATE = '2024-12-01'
 SIZE_WINDOW = 0.1
 
@@ -25,48 +26,141 @@ EVENTS = {
     "9% PPLTT": "2023-10-01",
 }
 
-
-def run_sc_with_donors(pivot_log, donor_list):
-    """Run synthetic control with a specific donor list. Returns synthetic series and stats."""
-    pre_mask = pivot_log.index < TREATMENT_DATE
-    pre_data = pivot_log[pre_mask]
-
-    # Keep donors with complete pre-period
-    valid_donors = [z for z in donor_list if z in pre_data.columns and pre_data[z].notna().all()]
-    if len(valid_donors) < 2:
-        return None, None, None, None
-
-    fit_data = pivot_log[pre_mask][[TREATED_ZIP] + valid_donors].dropna()
-    if len(fit_data) < 3:
-        return None, None, None, None
-
-    y_treated = fit_data[TREATED_ZIP].values
-    X_donors = fit_data[valid_donors].values
-
-    def objective(w):
-        synth = X_donors @ w
-        return np.mean((y_treated - synth) ** 2)
-
-    constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1}]
-    bounds = [(0, 1) for _ in valid_donors]
-    w0 = np.ones(len(valid_donors)) / len(valid_donors)
-
-    result = minimize(objective, w0, method='SLSQP', bounds=bounds, constraints=constraints)
-    weights = result.x
-    rmse = np.sqrt(result.fun)
-
-    # Compute synthetic for full period
-    full_data = pivot_log[[TREATED_ZIP] + valid_donors].dropna()
-    full_data = full_data[full_data.index < END_DATE]
-    synth_series = pd.Series(full_data[valid_donors].values @ weights, index=full_data.index)
-
-    # Treatment effect
-    pre_gap = full_data[full_data.index < TREATMENT_DATE][TREATED_ZIP].mean() - \
-              synth_series[synth_series.index < TREATMENT_DATE].mean()
-    post_gap = full_data[full_data.index >= TREATMENT_DATE][TREATED_ZIP].mean() - \
-               synth_series[synth_series.index >= TREATMENT_DATE].mean()
-
-    return synth_series, rmse, pre_gap, post_gap
+# One row of leave_k_out_results.csv, less the removed-donor label
+RESULT_DTYPE = [('k', 'i4'), ('rmse', 'f8'), ('pre_gap', 'f8'), ('post_gap', 'f8')]
+
+
+def project_simplex(v, keep):
+    """Euclidean projection of each row of v onto the simplex over its kept entries.
+
+    Dropped entries (keep == False) come back as exactly zero. Sort-based
+    projection (Duchi et al. 2008), vectorized over rows.
+    """
+    v = np.where(keep, v, -np.inf)
+    u = -np.sort(-v, axis=1)
+    css = np.cumsum(np.where(np.isfinite(u), u, 0.0), axis=1) - 1
+    j = np.arange(1, v.shape[1] + 1)
+    rho = (u - css / j > 0).sum(axis=1)
+    theta = css[np.arange(len(v)), rho - 1] / rho
+    return np.where(keep, np.maximum(v - theta[:, None], 0.0), 0.0)
+
+
+def solve_simplex_batch(G, Xty, keep, w0=None, iters=10_000, tol=1e-10):
+    """Minimize ||y - X w||^2 over the simplex for many donor subsets at once.
+
+    Takes the Gram matrix G = X.T @ X and Xty = X.T @ y of the full (T, D)
+    pre-period donor matrix, so the iterations never touch X. Row i of the
+    (n, D) bool mask keep marks the donors problem i may use; a subset's Gram
+    is G with the dropped rows/columns zeroed out by its weights. Runs
+    accelerated projected gradient on all n problems together and returns
+    (n, D) weights, zero on dropped donors.
+
+    w0 (D,) warm-starts every problem from a nearby solution, e.g. the
+    baseline weights, projected onto that problem's simplex. Each problem
+    stops iterating once its weights move by less than tol.
+    """
+    keep = np.atleast_2d(keep)
+    # Step from the full problem's Lipschitz constant; every sub-problem's is smaller
+    step = 1 / (2 * np.linalg.eigvalsh(G)[-1])
+    if w0 is None:
+        w = keep / keep.sum(axis=1, keepdims=True)
+    else:
+        w = project_simplex(np.broadcast_to(w0, keep.shape), keep)
+    z, t = w.copy(), 1.0
+    active = np.arange(len(w))
+    for _ in range(iters):
+        grad = 2 * (z[active] @ G - Xty)
+        w_next = project_simplex(z[active] - step * grad, keep[active])
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        z[active] = w_next + ((t - 1) / t_next) * (w_next - w[active])
+        moved = np.abs(w_next - w[active]).max(axis=1)
+        w[active], t = w_next, t_next
+        active = active[moved >= tol]
+        if len(active) == 0:
+            break
+    return w
+
+
+def sc_arrays(log_users, months, zip3s, donor_list):
+    """Treated and donor arrays for the SC fits, sliced out of the log panel once.
+
+    log_users is the month x ZIP3 log outcome matrix, with row labels months
+    (a DatetimeIndex) and column labels zip3s. Keeps donors with a complete
+    pre-period. Every fit then works on these arrays by donor position, with
+    no pandas slicing or dropna. The donor matrices are made C-contiguous
+    here, once, so the solver's products never stride over a column-major
+    layout.
+    """
+    col = {z: i for i, z in enumerate(zip3s)}
+    pre = np.asarray(months < TREATMENT_DATE)
+    full = np.asarray(months < END_DATE)
+    treated = log_users[:, col[TREATED_ZIP]]
+    donors = [z for z in donor_list
+              if z in col and not np.isnan(log_users[pre, col[z]]).any()]
+    idx = [col[z] for z in donors]
+
+    return {
+        'donors': donors,
+        'y_pre': treated[pre],
+        'X_pre': np.ascontiguousarray(log_users[np.ix_(pre, idx)]),
+        'y_full': treated[full],
+        'X_full': np.ascontiguousarray(log_users[np.ix_(full, idx)]),
+        'full_index': months[full],
+        'is_pre': pre[full],
+    }
+
+
+def run_sc_leave_out(arrays, combos, w_base=None):
+    """Leave-k-out SC: one batched solve for every combo of removed donors.
+
+    arrays come from sc_arrays; each combo is a tuple of its donors to drop.
+    w_base, the baseline weights over those donors, warm-starts every fit.
+    Returns one (synth_series, rmse, pre_gap, post_gap) per combo, with Nones
+    where fewer than two donors or three pre-period months remain, and the
+    (n_combos, n_donors) weights.
+    """
+    y, X = arrays['y_pre'], arrays['X_pre']
+
+    pos = {z: i for i, z in enumerate(arrays['donors'])}
+    keep = np.ones((len(combos), len(pos)), dtype=bool)
+    for i, removed in enumerate(combos):
+        keep[i, [pos[z] for z in removed]] = False
+    solvable = (keep.sum(axis=1) >= 2) & (len(y) >= 3)
+
+    # Gram factors once for all combos; each combo's MSE comes from them too
+    G, Xty = X.T @ X, X.T @ y
+    weights = np.zeros(keep.shape)
+    if solvable.any():
+        weights[solvable] = solve_simplex_batch(G, Xty, keep[solvable], w0=w_base)
+    sse = y @ y - 2 * weights @ Xty + np.einsum('nd,de,ne->n', weights, G, weights)
+    rmse = np.sqrt(np.maximum(sse, 0.0) / len(y))
+
+    # Full period: a month is usable for a combo only if none of its
+    # remaining donors is missing there
+    y_full, X_full, is_pre = arrays['y_full'], arrays['X_full'], arrays['is_pre']
+    missing = np.isnan(X_full).astype(np.float64) @ keep.T > 0
+    synth = np.nan_to_num(X_full) @ weights.T
+
+    out = []
+    for i in range(len(combos)):
+        if not solvable[i]:
+            out.append((None, None, None, None))
+            continue
+        ok = ~missing[:, i]
+        gap = y_full[ok] - synth[ok, i]
+        out.append((pd.Series(synth[ok, i], index=arrays['full_index'][ok]), rmse[i],
+                    gap[is_pre[ok]].mean(), gap[~is_pre[ok]].mean()))
+    return out, weights
+
+
+def run_sc_with_donors(arrays):
+    """Run synthetic control on all donors in arrays.
+
+    Returns synthetic series and stats, plus the donor weights and the donors
+    they belong to.
+    """
+    fits, weights = run_sc_leave_out(arrays, [()])
+    return (*fits[0], weights[0], arrays['donors'])
 
 
 def main():
@@ -75,107 +169,113 @@ def main():
     log("Selecting size-matched controls (matching on n_users)...")
 
     early = trans[(trans['trans_date'] >= START_DATE) & (trans['trans_date'] < '2023-07-01')]
-    counts = early.groupby('zip3')['cardid'].nunique().reset_index(name='size_metric')
+    counts = early.groupby('zip3', observed=True)['cardid'].nunique().reset_index(name='size_metric')
 
     chicago_size = counts[counts['zip3'] == TREATED_ZIP]['size_metric'].values[0]
     lower = chicago_size * (1 - SIZE_WINDOW)
     upper = chicago_size * (1 + SIZE_WINDOW)
 
-    similar = counts[(counts['size_metric'] >= lower) & (counts['size_metric'] <= upper)]
-    similar = similar[similar['zip3'] != TREATED_ZIP]
-    similar = similar[similar['zip3'].str.match(r'^\d{3}$')]
-    control_zips = similar['zip3'].tolist()
+    # One mask: size window, not Chicago, and a well-formed 3-digit ZIP3
+    size = counts['size_metric'].to_numpy()
+    zips = counts['zip3'].astype(str)
+    mask = ((size >= lower) & (size <= upper) & (zips != TREATED_ZIP)
+            & (zips.str.len() == 3) & zips.str.isdigit())
+    control_zips = zips[mask].tolist()
 
     log(f"Chicago unique users (Mar-Jun 2023): {chicago_size}")
     log(f"Control ZIP3s (within {SIZE_WINDOW*100:.0f}%): {len(control_zips)}")
 
     # Filter data
     all_zips = [TREATED_ZIP] + control_zips
-    trans = trans[trans['zip3'].isin(all_zips)].copy()
-    trans = trans[(trans['trans_date'] >= START_DATE) & (trans['trans_date'] < END_DATE)].copy()
-
-    # Monthly panel
-    trans['month'] = trans['trans_date'].dt.to_period('M')
-    monthly = trans.groupby(['zip3', 'month']).agg(
-        n_users=('cardid', 'nunique')
-    ).reset_index()
-    monthly['month_dt'] = monthly['month'].dt.to_timestamp()
-
-    pivot = monthly.pivot(index='month_dt', columns='zip3', values='n_users')
-    pivot_log = np.log(pivot)
-    pivot_log = pivot_log.dropna(subset=[TREATED_ZIP])
+    trans = trans[trans['zip3'].isin(all_zips)
+                  & (trans['trans_date'] >= START_DATE) & (trans['trans_date'] < END_DATE)]
+
+    # Monthly panel: unique users per (zip3, month) = distinct
+    # (zip3, month, cardid) triples, counted on integer codes rather than
+    # through groupby-nunique over the string keys
+    zip3_code = trans['zip3'].cat.codes.to_numpy().astype(np.int64)
+    month_idx, months = pd.factorize(month_code(trans['trans_date']), sort=True)
+    card_code, cards = pd.factorize(trans['cardid'])
+    cell = zip3_code * len(months) + month_idx
+    triples = np.unique(cell * len(cards) + card_code)
+    n_users = np.bincount(triples // len(cards),
+                          minlength=len(trans['zip3'].cat.categories) * len(months))
+    n_users = n_users.reshape(-1, len(months)).T
+
+    # month x zip3 log users, NaN where a ZIP3 had no users that month; kept
+    # as a plain array with its month/ZIP3 labels alongside
+    present = n_users > 0
+    has_users = present.any(axis=0)
+    log_users = np.log(np.where(present, n_users, np.nan)[:, has_users])
+    zip3s = trans['zip3'].cat.categories.astype(str)[has_users]
+    months = pd.DatetimeIndex(month_start(months), name='month_dt')
+
+    # Months where Chicago is observed
+    has_chicago = ~np.isnan(log_users[:, zip3s.get_loc(TREATED_ZIP)])
+    log_users, months = log_users[has_chicago], months[has_chicago]
 
     # Get Chicago series
-    chicago_series = pivot_log[TREATED_ZIP][pivot_log.index < END_DATE]
+    in_window = months < END_DATE
+    chicago_series = pd.Series(log_users[in_window, zip3s.get_loc(TREATED_ZIP)],
+                               index=months[in_window], name=TREATED_ZIP)
 
     # Output directory
     out_dir = get_output_dir() / 'robustness'
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    # Pre/full-period arrays over the valid donors, shared by every fit
+    arrays = sc_arrays(log_users, months, zip3s, control_zips)
+
     # Run baseline
     log("Running baseline SC...")
-    base_synth, base_rmse, base_pre, base_post = run_sc_with_donors(pivot_log, control_zips)
+    base_synth, base_rmse, base_pre, base_post, weights, valid_donors = run_sc_with_donors(arrays)
     log(f"Baseline: RMSE={base_rmse:.4f}, pre_gap={base_pre:.4f}, post_gap={base_post:.4f}")
 
     # Get donors with >1% weight from baseline
-    pre_mask = pivot_log.index < TREATMENT_DATE
-    pre_data = pivot_log[pre_mask]
-    valid_donors = [z for z in control_zips if z in pre_data.columns and pre_data[z].notna().all()]
-    fit_data = pivot_log[pre_mask][[TREATED_ZIP] + valid_donors].dropna()
-
-    y_treated = fit_data[TREATED_ZIP].values
-    X_donors = fit_data[valid_donors].values
-
-    def objective(w):
-        return np.mean((y_treated - X_donors @ w) ** 2)
-
-    constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1}]
-    bounds = [(0, 1) for _ in valid_donors]
-    w0 = np.ones(len(valid_donors)) / len(valid_donors)
-    result = minimize(objective, w0, method='SLSQP', bounds=bounds, constraints=constraints)
-
-    weight_df = pd.DataFrame({'zip3': valid_donors, 'weight': result.x})
+    weight_df = pd.DataFrame({'zip3': valid_donors, 'weight': weights})
     top_donors = weight_df[weight_df['weight'] > 0.01]['zip3'].tolist()
     log(f"Top donors (>1% weight): {len(top_donors)} - {top_donors}")
 
-    # Results storage
-    results = []
-    results.append({
-        'k': 0,
-        'removed': '',
-        'rmse': base_rmse,
-        'pre_gap': base_pre,
-        'post_gap': base_post
-    })
-
-    # Leave-k-out for k = 1 to len(top_donors)
+    # Leave-k-out for k = 1 to len(top_donors); every combo of every k is
+    # independent, so all of them go through the solver as one batch
     max_k = len(top_donors)
+    combos_by_k = {k: list(combinations(top_donors, k)) for k in range(1, max_k + 1)}
+    all_combos = [removed for combos in combos_by_k.values() for removed in combos]
+    log(f"Solving {len(all_combos)} leave-k-out fits in one batch...")
+    fits, _ = run_sc_leave_out(arrays, all_combos, w_base=weights)
+    fits = dict(zip(all_combos, fits))
+
+    # Results storage: a preallocated row per fit (baseline + every combo),
+    # with the removed-donor labels in a parallel list
+    results = np.empty(len(all_combos) + 1, dtype=RESULT_DTYPE)
+    results[0] = (0, base_rmse, base_pre, base_post)
+    removed_labels = ['']
+    n_results = 1
+
+    # One figure for every k, cleared between plots
+    fig, ax = plt.subplots(figsize=(12, 6))
+    end_ts = chicago_series.index.max()
 
     for k in range(1, max_k + 1):
-        combos = list(combinations(top_donors, k))
+        combos = combos_by_k[k]
         log(f"Running leave-{k}-out ({len(combos)} combinations)...")
 
         # Collect all synthetic series for this k
         synth_lines = []
         combo_labels = []
+        k_start = n_results
 
         for removed in combos:
-            remaining = [z for z in control_zips if z not in removed]
-            synth_series, rmse, pre_gap, post_gap = run_sc_with_donors(pivot_log, remaining)
-
+            synth_series, rmse, pre_gap, post_gap = fits[removed]
             if synth_series is not None:
                 synth_lines.append(synth_series)
                 combo_labels.append(','.join(removed))
-                results.append({
-                    'k': k,
-                    'removed': ','.join(removed),
-                    'rmse': rmse,
-                    'pre_gap': pre_gap,
-                    'post_gap': post_gap
-                })
+                results[n_results] = (k, rmse, pre_gap, post_gap)
+                removed_labels.append(','.join(removed))
+                n_results += 1
 
         # Create plot for this k
-        fig, ax = plt.subplots(figsize=(12, 6))
+        ax.cla()
 
         # Plot Chicago (thick blue)
         ax.plot(chicago_series.index, chicago_series.values, marker='o', linewidth=2.5,
@@ -185,17 +285,17 @@ def main():
         ax.plot(base_synth.index, base_synth.values, linewidth=2.5,
                 color='orange', linestyle='--', label='Baseline SC', zorder=9)
 
-        # Plot all leave-k-out synthetics (thin gray)
-        for i, synth in enumerate(synth_lines):
-            label = f'Leave-{k}-out' if i == 0 else None
-            ax.plot(synth.index, synth.values, linewidth=0.8,
-                    color='gray', alpha=0.5, label=label, zorder=1)
+        # Plot all leave-k-out synthetics (thin gray) as one collection
+        segments = [np.column_stack([mdates.date2num(synth.index), synth.to_numpy()])
+                    for synth in synth_lines]
+        ax.add_collection(LineCollection(segments, linewidths=0.8, colors='gray',
+                                         alpha=0.5, label=f'Leave-{k}-out', zorder=1))
+        ax.autoscale_view()
 
         # Shade treatment period
-        ax.axvspan(pd.to_datetime(TREATMENT_DATE), chicago_series.index.max(),
-                   alpha=0.15, color='red')
+        ax.axvspan(TREATMENT_TS, end_ts, alpha=0.15, color='red')
 
-        ax.axvline(pd.to_datetime(TREATMENT_DATE), color='red', linestyle='--', alpha=0.7)
+        ax.axvline(TREATMENT_TS, color='red', linestyle='--', alpha=0.7)
 
         ax.set_xlabel('Month')
         ax.set_ylabel('Log n_users')
@@ -205,20 +305,22 @@ def main():
         ax.tick_params(axis='x', rotation=45)
 
         # Summary stats in annotation
-        post_gaps = [r['post_gap'] for r in results if r['k'] == k]
+        post_gaps = results['post_gap'][k_start:n_results]
         note = (f"Baseline post_gap: {base_post:.3f}\n"
                 f"Leave-{k}-out post_gap:\n"
                 f"  mean={np.mean(post_gaps):.3f}, min={np.min(post_gaps):.3f}, max={np.max(post_gaps):.3f}")
         ax.text(0.02, 0.02, note, transform=ax.transAxes, fontsize=8,
                 verticalalignment='bottom', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
-        plt.tight_layout()
-        plt.savefig(out_dir / f'leave_{k}_out.png', dpi=150, bbox_inches='tight')
-        plt.close(fig)
+        fig.tight_layout()
+        fig.savefig(out_dir / f'leave_{k}_out.png', dpi=150, bbox_inches='tight')
         log(f"  Saved: {out_dir / f'leave_{k}_out.png'}")
 
+    plt.close(fig)
+
     # Save results CSV
-    results_df = pd.DataFrame(results)
+    results_df = pd.DataFrame(results[:n_results])
+    results_df.insert(1, 'removed', removed_labels)
     results_df.to_csv(out_dir / 'leave_k_out_results.csv', index=False)
     log(f"Saved: {out_dir / 'leave_k_out_results.csv'}")
 
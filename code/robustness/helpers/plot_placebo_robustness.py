@@ -8,26 +8,51 @@ NOTE: Don't run directly. Use run_placebo_plots.py instead:
 
 import sys
 import re
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import stats
+from scipy.special import stdtr
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 from config import get_output_dir
+from load_data import read_dta_cached
 
 DATA_DIR = get_output_dir()
 OUT_DIR = DATA_DIR / 'synthetic_placebo_robustness'
 DERIVED_DIR = Path('/Users/jeffreyohl/Dropbox/LLM_PassThrough/derived_data')
 
-# Threshold multiplier for pre-RMSPE filter (Abadie uses 2x, 5x, 20x)
-THRESHOLD_MULT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+# Default threshold multiplier for pre-RMSPE filter (Abadie uses 2x, 5x, 20x)
+THRESHOLD_MULT = 5
 
 
+def ols1(x, y):
+    """Simple OLS of y on x: (slope, intercept, r, two-sided p for slope).
+
+    Same numbers as scipy.stats.linregress, without importing scipy.stats.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.size
+    dx, dy = x - x.mean(), y - y.mean()
+    sxx, sxy, syy = dx @ dx, dx @ dy, dy @ dy
+    slope = sxy / sxx
+    intercept = y.mean() - slope * x.mean()
+    r = sxy / np.sqrt(sxx * syy)
+    t = r * np.sqrt((n - 2) / max(1 - r**2, np.finfo(float).tiny))
+    p = 2 * stdtr(n - 2, -abs(t))
+    return slope, intercept, r, p
+
+
+@lru_cache(maxsize=None)
 def get_chicago_stats():
-    """Compute Chicago stats from synth_results.dta (no hardcoding)."""
-    results = pd.read_stata(DATA_DIR / 'synth_results.dta')
+    """Compute Chicago stats from synth_results.dta (no hardcoding).
+
+    Cached: the spaghetti plot reuses these stats when both run in one process.
+    """
+    results = read_dta_cached(DATA_DIR / 'synth_results.dta',
+                              columns=['_time', '_Y_treated', '_Y_synthetic'])
     results['gap'] = results['_Y_treated'] - results['_Y_synthetic']
     results['gap_sq'] = results['gap'] ** 2
 
@@ -47,36 +72,50 @@ def get_chicago_stats():
     }
 
 
-def parse_log():
-    """Parse completed units from log file, including zip3_id and signed gaps."""
-    results = []
+# "Placebo N: zip3_id = X" then "  pre=..., post=..., ratio=..., post_gap=..."
+# (post_gap is the signed mean post-period gap)
+PLACEBO_HEADER = re.compile(r'Placebo \d+: zip3_id = (\d+)\s*$')
+PLACEBO_STATS = re.compile(
+    r'\s*pre=([\d.]+), post=([\d.]+), ratio=([\d.]+), post_gap=([-\d.]+)')
 
-    with open('chicago_synth_placebo_topq.log', 'r') as f:
-        content = f.read()
 
-    # Remove line continuations (> at start of line) for wrapped output
-    content = re.sub(r'\n> ?', '', content)
+def _log_lines(f):
+    """Yield log lines with Stata's wrapped continuations ("> ...") rejoined."""
+    line = None
+    for raw in f:
+        raw = raw.rstrip('\n')
+        if line is not None and raw.startswith('>'):
+            line += raw[2:] if raw.startswith('> ') else raw[1:]
+            continue
+        if line is not None:
+            yield line
+        line = raw
+    if line is not None:
+        yield line
+
 
-    # Pattern includes post_gap (signed mean post-period gap)
-    # "Placebo N: zip3_id = X" then "  pre=..., post=..., ratio=..., post_gap=..."
-    pattern = (r'Placebo \d+: zip3_id = (\d+)\s+'
-               r'pre=([\d.]+), post=([\d.]+), ratio=([\d.]+), post_gap=([-\d.]+)')
+def parse_log():
+    """Parse completed units from log file, including zip3_id and signed gaps.
 
-    for match in re.finditer(pattern, content):
-        zip3_id = int(match.group(1))
-        pre = float(match.group(2))
-        post = float(match.group(3))
-        ratio = float(match.group(4))
-        post_gap = float(match.group(5))
-        results.append({
-            'zip3_id': zip3_id,
-            'pre_rmspe': pre,
-            'post_rmspe': post,
-            'ratio': ratio,
-            'post_gap': post_gap  # signed mean post-period gap
-        })
+    Streams the log one line at a time: a header line arms the parser and the
+    next non-blank line completes the record if it is the stats line.
+    """
+    records = []
+    zip3_id = None
+
+    with open('chicago_synth_placebo_topq.log', 'r') as f:
+        for line in _log_lines(f):
+            if zip3_id is not None:
+                if not line.strip():
+                    continue
+                match = PLACEBO_STATS.match(line)
+                if match:
+                    records.append((zip3_id, *map(float, match.groups())))
+            header = PLACEBO_HEADER.search(line)
+            zip3_id = int(header.group(1)) if header else None
 
-    return pd.DataFrame(results)
+    return pd.DataFrame.from_records(
+        records, columns=['zip3_id', 'pre_rmspe', 'post_rmspe', 'ratio', 'post_gap'])
 
 
 def load_placebo_results():
@@ -85,13 +124,13 @@ def load_placebo_results():
 
     if dta_path.exists():
         print(f"Loading from {dta_path}")
-        return pd.read_stata(dta_path)
+        return read_dta_cached(dta_path)
     else:
         print("No .dta file found, parsing log...")
         return parse_log()
 
 
-def main():
+def main(threshold_mult=THRESHOLD_MULT):
     # Get Chicago stats from synth_results.dta (no hardcoding)
     chi = get_chicago_stats()
     print(f"Chicago: pre_rmspe={chi['pre_rmspe']:.4f}, "
@@ -106,7 +145,8 @@ def main():
         return
 
     # Load panel for population, zip3 codes, and pre-period users
-    panel = pd.read_stata('data/synth_panel.dta')
+    panel = read_dta_cached('data/synth_panel.dta',
+                            columns=['zip3_id', 'zip3', 'month_num', 'n_users', 'population'])
 
     # Pre-period mean users (month_num < 10 is pre-treatment)
     pre_users = panel[panel['month_num'] < 10].groupby('zip3_id').agg(
@@ -146,9 +186,9 @@ def main():
     chicago_gap_ratio = chi['post_gap'] / chi['pre_rmspe']
 
     # Filter to good pre-fit
-    threshold = chi['pre_rmspe'] * THRESHOLD_MULT
+    threshold = chi['pre_rmspe'] * threshold_mult
     good = df[df['pre_rmspe'] < threshold].copy()
-    thresh_label = f"{THRESHOLD_MULT}x"
+    thresh_label = f"{threshold_mult}x"
 
     # Ensure output dirs exist
     OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -168,7 +208,7 @@ def main():
                alpha=0.5, s=50, c='gray', label='Placebo units (good fit)')
 
     # Regression line
-    slope2, intercept2, r2, p2, se2 = stats.linregress(
+    slope2, intercept2, r2, p2 = ols1(
         good_plac['population']/1e6, good_plac['ratio'])
     x_line2 = np.linspace(0, good_plac['population'].max()/1e6, 100)
     ax.plot(x_line2, slope2 * x_line2 + intercept2, 'b-', linewidth=2,
@@ -211,7 +251,7 @@ def main():
                alpha=0.5, s=50, c='gray', label='Placebo units (good fit)')
 
     # Regression line
-    slope3, intercept3, r3, p3, se3 = stats.linregress(
+    slope3, intercept3, r3, p3 = ols1(
         good_plac3['pre_users'], good_plac3['ratio'])
     x_line3 = np.linspace(0, good_plac3['pre_users'].max(), 100)
     ax.plot(x_line3, slope3 * x_line3 + intercept3, 'b-', linewidth=2,
@@ -258,7 +298,7 @@ def main():
                    alpha=0.5, s=50, c='gray', label='Placebo units')
 
         # Regression line
-        slope4, intercept4, r4, p4, se4 = stats.linregress(
+        slope4, intercept4, r4, p4 = ols1(
             good_plac4['pre_users'], good_plac4['gap_ratio'])
         x_line4 = np.linspace(0, good_plac4['pre_users'].max(), 100)
         ax.plot(x_line4, slope4 * x_line4 + intercept4, 'b-', linewidth=2,
@@ -371,4 +411,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else THRESHOLD_MULT)
@@ -8,46 +8,38 @@ NOTE: Don't run directly. Use run_placebo_plots.py instead:
 """
 
 import sys
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 from config import get_output_dir
+from load_data import read_dta_cached
+from plot_placebo_robustness import THRESHOLD_MULT, get_chicago_stats
 
 DATA_DIR = get_output_dir()
 OUT_DIR = DATA_DIR / 'synthetic_placebo_robustness'
 
-THRESHOLD_MULT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
 
-
-def get_chicago_stats():
-    """Compute Chicago pre-RMSPE from synth_results.dta."""
-    results = pd.read_stata(DATA_DIR / 'synth_results.dta')
-    results['gap'] = results['_Y_treated'] - results['_Y_synthetic']
-    results['gap_sq'] = results['gap'] ** 2
-    pre = results[results['_time'] < 10]
-    return np.sqrt(pre['gap_sq'].mean())
-
-
-def main():
+def main(threshold_mult=THRESHOLD_MULT):
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Get Chicago's pre-RMSPE for threshold
-    chi_pre_rmspe = get_chicago_stats()
-    threshold = chi_pre_rmspe * THRESHOLD_MULT
+    # Get Chicago's pre-RMSPE for threshold (shared with plot_placebo_robustness)
+    chi_pre_rmspe = get_chicago_stats()['pre_rmspe']
+    threshold = chi_pre_rmspe * threshold_mult
     print(f"Chicago pre-RMSPE: {chi_pre_rmspe:.4f}")
-    print(f"Threshold ({THRESHOLD_MULT}x): {threshold:.4f}")
+    print(f"Threshold ({threshold_mult}x): {threshold:.4f}")
 
     # Load placebo series (has gap for each unit at each time)
-    series = pd.read_stata(DATA_DIR / 'placebo_series_long.dta')
+    series = read_dta_cached(DATA_DIR / 'placebo_series_long.dta',
+                             columns=['zip3_id', 'month_num', 'gap'])
     print(f"Loaded {len(series)} rows from placebo_series_long.dta")
 
-    # Compute pre-RMSPE for each unit to filter
-    pre_rmspe = series[series['month_num'] < 10].groupby('zip3_id').agg(
-        pre_rmspe=('gap', lambda x: np.sqrt((x**2).mean()))
-    ).reset_index()
+    # Compute pre-RMSPE for each unit to filter (cythonized mean, one sqrt)
+    pre = series.loc[series['month_num'] < 10, ['zip3_id', 'gap']]
+    pre_rmspe = np.sqrt((pre['gap'] ** 2).groupby(pre['zip3_id']).mean()
+                        ).rename('pre_rmspe').reset_index()
 
     # Filter to good pre-fit units
     good_units = pre_rmspe[pre_rmspe['pre_rmspe'] < threshold]['zip3_id'].values
@@ -61,11 +53,13 @@ def main():
     # Plot
     fig, ax = plt.subplots(figsize=(12, 7))
 
-    # Gray spaghetti for placebos
-    for unit_id in placebos['zip3_id'].unique():
-        unit = placebos[placebos['zip3_id'] == unit_id].sort_values('month_num')
-        ax.plot(unit['month_num'], unit['gap'],
-                color='gray', alpha=0.3, linewidth=0.8)
+    # Gray spaghetti for placebos: one LineCollection, not a Line2D per unit
+    placebos = placebos.sort_values(['zip3_id', 'month_num'])
+    xy = placebos[['month_num', 'gap']].to_numpy(dtype=float)
+    _, counts = np.unique(placebos['zip3_id'].to_numpy(), return_counts=True)
+    segments = np.split(xy, np.cumsum(counts)[:-1])
+    ax.add_collection(LineCollection(segments, colors='gray', alpha=0.3, linewidths=0.8))
+    ax.autoscale_view()
 
     # Black line for Chicago
     ax.plot(chicago['month_num'], chicago['gap'],
@@ -79,7 +73,7 @@ def main():
     ax.set_xlabel('Month', fontsize=12)
     ax.set_ylabel('Gap (Treated − Synthetic)', fontsize=12)
     ax.set_title(f'Placebo Gaps: Chicago vs Control ZIP3s\n'
-                 f'(pre-RMSPE < {THRESHOLD_MULT}× Chicago, n={len(good_units)})',
+                 f'(pre-RMSPE < {threshold_mult}× Chicago, n={len(good_units)})',
                  fontsize=14)
 
     # Add text annotation for treatment
@@ -96,11 +90,11 @@ def main():
     ax.legend(handles=legend_elements, loc='lower left')
 
     plt.tight_layout()
-    outfile = OUT_DIR / f'placebo_spaghetti_{THRESHOLD_MULT}x.png'
+    outfile = OUT_DIR / f'placebo_spaghetti_{threshold_mult}x.png'
     plt.savefig(outfile, dpi=150)
     print(f"Saved: {outfile}")
     plt.close()
 
 
 if __name__ == "__main__":
-    main()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else THRESHOLD_MULT)
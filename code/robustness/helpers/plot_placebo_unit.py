@@ -1,65 +1,113 @@
 #!/usr/bin/env python3
-"""Plot synthetic control for a single placebo unit.
+"""Plot synthetic control for placebo units.
 
-Usage: python plot_placebo_unit.py ZIP3
+Usage: python plot_placebo_unit.py ZIP3 [ZIP3 ...]
+       python plot_placebo_unit.py all
 Example: python plot_placebo_unit.py 077
+         python plot_placebo_unit.py 077 606 900
+
+All requested units are plotted in one process from a single read of
+placebo_series_long.dta.
 """
 
 import sys
-import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import numpy as np
+import pyarrow.dataset as ds
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 from config import get_output_dir, get_outcome_label
+from load_data import read_dta_cached
+
+SERIES_COLS = ['zip3_id', 'month_num', 'y_treated', 'y_synthetic']
+
+
+def zip3_to_id(zip3_input):
+    """'077' -> 77"""
+    return int(zip3_input.lstrip('0')) if zip3_input.lstrip('0') else 0
+
+
+def setup_figure(outcome_label):
+    """Build the figure once (mimic Stata style); units only swap line data."""
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    treated, = ax.plot([], [], 'k-', linewidth=1.5, label='treated unit')
+    synthetic, = ax.plot([], [], 'k--', linewidth=1.5, label='synthetic control unit')
+
+    # Treatment line
+    ax.axvline(x=10, color='black', linestyle=':', alpha=0.7)
 
-if len(sys.argv) != 2:
-    print("Usage: python plot_placebo_unit.py ZIP3")
-    print("Example: python plot_placebo_unit.py 077")
-    sys.exit(1)
+    ax.set_xlabel('month_num')
+    ax.set_ylabel(outcome_label)
+    ax.legend(loc='upper left', frameon=False)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    return fig, ax, treated, synthetic
 
-zip3_input = sys.argv[1]
-# Handle '077' -> 77
-zip3_id = int(zip3_input.lstrip('0')) if zip3_input.lstrip('0') else 0
 
-# Paths (from load_chatgpt_data settings)
-DATA_DIR = get_output_dir()
-OUT_DIR = DATA_DIR / 'synthetic_placebo_robustness' / 'placebo_sc_plots'
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-outcome_label = get_outcome_label()
+def plot_unit(figure, unit, zip3_label, out_dir):
+    """Draw one unit's treated vs synthetic series on the shared figure and save."""
+    fig, ax, treated, synthetic = figure
+    treated.set_data(unit['month_num'], unit['y_treated'])
+    synthetic.set_data(unit['month_num'], unit['y_synthetic'])
+    ax.relim()
+    ax.autoscale_view()
 
-# Load placebo series
-df = pd.read_stata(DATA_DIR / 'placebo_series_long.dta')
+    fig.tight_layout()
+    outfile = out_dir / f'placebo_zip3_{zip3_label}.png'
+    fig.savefig(outfile, dpi=150)
+    print(f"Saved: {outfile}")
 
-# Filter to requested unit
-unit = df[df['zip3_id'] == zip3_id].sort_values('month_num')
 
-if len(unit) == 0:
-    print(f"ERROR: zip3 {zip3_input} (id={zip3_id}) not in placebo data")
-    avail = sorted(df['zip3_id'].unique())[:30]
-    print(f"Available (first 30): {avail}")
-    sys.exit(1)
+def main(zip3_inputs):
+    # Paths (from load_chatgpt_data settings)
+    data_dir = get_output_dir()
+    out_dir = data_dir / 'synthetic_placebo_robustness' / 'placebo_sc_plots'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    outcome_label = get_outcome_label()
+    series_path = data_dir / 'placebo_series_long.dta'
 
-print(f"Plotting placebo synth for zip3 {zip3_input} ({len(unit)} months)")
+    # Load the requested units' placebo series in one read. The cached copy
+    # is sorted by zip3_id, so the filter reads just the matching row groups.
+    if zip3_inputs == ['all']:
+        df = read_dta_cached(series_path, columns=SERIES_COLS, sort_by='zip3_id')
+        labels = {i: f'{i:03d}' for i in df['zip3_id'].unique()}
+    else:
+        labels = {zip3_to_id(z): z for z in zip3_inputs}
+        df = read_dta_cached(series_path, columns=SERIES_COLS,
+                             row_filter=ds.field('zip3_id').isin(list(labels)),
+                             sort_by='zip3_id')
 
-# Plot (mimic Stata style)
-fig, ax = plt.subplots(figsize=(10, 6))
+    # Locate each unit's contiguous block in the zip3_id-sorted frame with two
+    # binary searches instead of an equality scan per unit
+    if not df['zip3_id'].is_monotonic_increasing:
+        df = df.sort_values('zip3_id', kind='stable', ignore_index=True)
+    zip3_ids = np.array(sorted(labels))
+    z = df['zip3_id'].to_numpy()
+    lo = np.searchsorted(z, zip3_ids, side='left')
+    hi = np.searchsorted(z, zip3_ids, side='right')
 
-ax.plot(unit['month_num'], unit['y_treated'],
-        'k-', linewidth=1.5, label='treated unit')
-ax.plot(unit['month_num'], unit['y_synthetic'],
-        'k--', linewidth=1.5, label='synthetic control unit')
+    missing = [labels[i] for i in zip3_ids[lo == hi]]
+    if missing:
+        print(f"ERROR: zip3 {', '.join(missing)} not in placebo data")
+        avail = sorted(read_dta_cached(series_path, columns=['zip3_id'],
+                                       sort_by='zip3_id')['zip3_id'].unique())[:30]
+        print(f"Available (first 30): {avail}")
+        sys.exit(1)
 
-# Treatment line
-ax.axvline(x=10, color='black', linestyle=':', alpha=0.7)
+    figure = setup_figure(outcome_label)
+    for zip3_id, start, stop in zip(zip3_ids, lo, hi):
+        unit = df.iloc[start:stop].sort_values('month_num')
+        print(f"Plotting placebo synth for zip3 {labels[zip3_id]} ({len(unit)} months)")
+        plot_unit(figure, unit, labels[zip3_id], out_dir)
+    plt.close(figure[0])
 
-ax.set_xlabel('month_num')
-ax.set_ylabel(outcome_label)
-ax.legend(loc='upper left', frameon=False)
-ax.grid(True, alpha=0.3, linestyle='--')
 
-plt.tight_layout()
-outfile = OUT_DIR / f'placebo_zip3_{zip3_input}.png'
-plt.savefig(outfile, dpi=150)
-print(f"Saved: {outfile}")
-plt.show()
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python plot_placebo_unit.py ZIP3 [ZIP3 ...] | all")
+        print("Example: python plot_placebo_unit.py 077")
+        sys.exit(1)
+    main(sys.argv[1:])
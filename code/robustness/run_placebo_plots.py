@@ -14,23 +14,24 @@ Generates:
   - placebo_spaghetti_{N}x.png
 """
 
-import subprocess
 import sys
 from pathlib import Path
 
-THRESHOLD = sys.argv[1] if len(sys.argv) > 1 else '5'
+# Both helpers run in this process: imports, the Chicago synth stats and the
+# cached .dta reads are shared instead of repeated per subprocess
+sys.path.insert(0, str(Path(__file__).parent / 'helpers'))
+import plot_placebo_robustness
+import plot_placebo_spaghetti
 
-helpers_dir = Path(__file__).parent / 'helpers'
+THRESHOLD = int(sys.argv[1]) if len(sys.argv) > 1 else 5
 
 print(f"=== Running placebo plots with {THRESHOLD}x threshold ===\n")
 
 # Run main robustness plots
 print("Running plot_placebo_robustness.py...")
-subprocess.run([sys.executable, helpers_dir / 'plot_placebo_robustness.py', THRESHOLD],
-               check=True)
+plot_placebo_robustness.main(THRESHOLD)
 
 print("\nRunning plot_placebo_spaghetti.py...")
-subprocess.run([sys.executable, helpers_dir / 'plot_placebo_spaghetti.py', THRESHOLD],
-               check=True)
+plot_placebo_spaghetti.main(THRESHOLD)
 
 print(f"\n=== Done! All {THRESHOLD}x plots generated. ===")
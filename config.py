@@ -9,6 +9,7 @@ from pathlib import Path
 from datetime import datetime
 
 DATA_DIR = Path("/Users/jeffreyohl/Dropbox/Gambling Papers and Data/CEdge data")
+DERIVED_DIR = Path("/Users/jeffreyohl/Dropbox/LLM_PassThrough/derived_data")
 
 # Filter modes (by transaction amount)
 FILTER_PLUS_RANGE = 'plus_range'    # $20-22 (ChatGPT Plus price range with tax variation)
@@ -32,6 +33,9 @@ OUTCOME_VAR = OUTCOME_TRANSACTIONS  # Changed from OUTCOME_USERS Jan 2026
 # Panel filter (constant individuals)
 USE_PANEL = True  # If True, restrict to cardlinkids active in all 70-day windows
 
+# Resolution for quick-look exploratory figures (raise for paper figures)
+EXPLORATORY_DPI = 100
+
 
 def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
@@ -4,9 +4,18 @@ Data loading for ChatGPT analysis.
 Imports settings from config.py.
 """
 
+import hashlib
+import os
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pathlib import Path
 from config import (
-    DATA_DIR, AMOUNT_FILTER, USE_TOP_MERCHANTS, USE_PANEL, TOP_N_MERCHANTS,
+    DATA_DIR, DERIVED_DIR, AMOUNT_FILTER, USE_TOP_MERCHANTS, USE_PANEL, TOP_N_MERCHANTS,
     FILTER_PLUS_RANGE, FILTER_WIDE_RANGE, FILTER_OUTSIDE, log
 )
 
@@ -16,6 +25,25 @@ _TOP_MERCHANTS_CACHE = None
 # Cache for panel cardids
 _PANEL_CARDIDS_CACHE = None
 
+# On-disk cache of load_with_zip3 output, one file per filter setting
+ZIP3_CACHE_DIR = DERIVED_DIR / "cache"
+
+# Row-group size for sorted .dta copies: a few dozen units per group
+SORTED_ROW_GROUP = 2048
+
+# Rows per StataReader chunk when building a .dta copy
+DTA_CHUNK_ROWS = 200_000
+
+
+def month_code(dates):
+    """Months since 1970-01 as int64: a cheap groupby key, no Period objects."""
+    return np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[M]').view('int64')
+
+
+def month_start(codes):
+    """Inverse of month_code: month-start timestamps (datetime64[ns])."""
+    return np.asarray(codes, dtype='int64').view('datetime64[M]').astype('datetime64[ns]')
+
 
 def _get_top_merchants(trans_raw):
     """Get top N merchants by count from full sample (no amount filter)."""
@@ -30,42 +58,79 @@ def _get_top_merchants(trans_raw):
 
 
 def _get_panel_cardids():
-    """Get cardids belonging to panel cardlinkids (active in all 70-day windows)."""
+    """Get cardids belonging to panel cardlinkids (active in all 70-day windows).
+
+    Returns a pyarrow array of unique cardids, used as the value_set of a
+    vectorized pc.is_in. The list is cached as Feather in ZIP3_CACHE_DIR, so
+    new processes skip re-reading panel_cardlinkids and card_info. Rebuilt
+    when either input is newer.
+    """
     global _PANEL_CARDIDS_CACHE
     if _PANEL_CARDIDS_CACHE is not None:
         return _PANEL_CARDIDS_CACHE
 
-    log("Loading panel cardlinkids...")
     panel_path = DATA_DIR / "panel_cardlinkids.parquet"
     if not panel_path.exists():
         raise FileNotFoundError(f"Panel file not found: {panel_path}. Run panelize.py first.")
 
+    card_info_path = DATA_DIR / "chatgpt_card_info_2025_12_26.parquet"
+    cache_path = ZIP3_CACHE_DIR / "panel_cardids.feather"
+    if cache_path.exists() and all(
+            f.stat().st_mtime <= cache_path.stat().st_mtime for f in (panel_path, card_info_path)):
+        panel_cardids = feather.read_table(cache_path).column('cardid').combine_chunks()
+        log(f"Panel cardids (cached): {len(panel_cardids):,}")
+        _PANEL_CARDIDS_CACHE = panel_cardids
+        return panel_cardids
+
+    log("Loading panel cardlinkids...")
+
     panel = pd.read_parquet(panel_path)
     panel_linkids = set(panel['cardlinkid'])
     log(f"  Panel cardlinkids: {len(panel_linkids):,}")
 
     # Map to cardids via card_info
-    card_info = pd.read_parquet(DATA_DIR / "chatgpt_card_info_2025_12_26.parquet")
+    card_info = pd.read_parquet(card_info_path)
     # Exclude USA1 debit (same filter as panelize.py)
     usa1_debit = (card_info['source_group'] == 1) & (card_info['cardtype'] == 'DEBIT')
     card_info = card_info[~usa1_debit]
 
     panel_cards = card_info[card_info['cardlinkid'].isin(panel_linkids)]
-    panel_cardids = set(panel_cards['cardid'])
+    panel_cardids = pa.array(panel_cards['cardid'].unique())
     log(f"  Panel cardids: {len(panel_cardids):,}")
 
+    ZIP3_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    feather.write_feather(pa.table({'cardid': panel_cardids}), tmp_path,
+                          compression='uncompressed')
+    os.replace(tmp_path, cache_path)
+
     _PANEL_CARDIDS_CACHE = panel_cardids
     return panel_cardids
 
 
+def _amount_filter_expr(amount_filter):
+    """Arrow scan predicate for an amount filter setting (None for FILTER_ALL)."""
+    amt = ds.field('trans_amount')
+    if amount_filter == FILTER_PLUS_RANGE:
+        return (amt >= 20) & (amt <= 22)
+    if amount_filter == FILTER_WIDE_RANGE:
+        return (amt >= 15) & (amt <= 25)
+    if amount_filter == FILTER_OUTSIDE:
+        return (amt < 20) | (amt > 22)
+    return None
+
+
 def load_transactions(services=('chatgpt', 'openai'), years=(2023, 2024, 2025),
-                      amount_filter=None, use_top_merchants=None, use_panel=None):
+                      amount_filter=None, use_top_merchants=None, use_panel=None,
+                      columns=None):
     """Load and filter ChatGPT transactions.
 
     amount_filter: 'subscriptions' (>=$20), 'api' (<$20), 'all' (no filter)
                    If None, uses module-level AMOUNT_FILTER setting.
     use_top_merchants: If None, uses module-level USE_TOP_MERCHANTS setting.
     use_panel: If None, uses module-level USE_PANEL setting.
+    columns: If given, only these columns (plus those the filters need)
+             are read from parquet. None reads every column.
     """
     if amount_filter is None:
         amount_filter = AMOUNT_FILTER
@@ -74,51 +139,82 @@ def load_transactions(services=('chatgpt', 'openai'), years=(2023, 2024, 2025),
     if use_panel is None:
         use_panel = USE_PANEL
 
+    read_cols = None
+    if columns is not None:
+        needed = ['service', 'cardid', 'trans_date', 'trans_amount']
+        if use_top_merchants:
+            needed.append('merchid')
+        read_cols = list(dict.fromkeys([*columns, *needed]))
+
     log("Loading transactions...")
-    dfs = []
-    for year in years:
-        f = DATA_DIR / f"chatgpt_transactions_{year}.parquet"
-        if f.exists():
-            dfs.append(pd.read_parquet(f))
-    trans = pd.concat(dfs, ignore_index=True)
-    log(f"Total transactions: {len(trans):,}")
-
-    # Filter to services
-    trans = trans[trans['service'].str.lower().isin(services)]
-    log(f"After service filter: {len(trans):,}")
-
-    # Apply panel filter (constant individuals)
+    files = [DATA_DIR / f"chatgpt_transactions_{year}.parquet" for year in years]
+    dataset = ds.dataset([str(f) for f in files if f.exists()], format='parquet')
+
+    # One scan over all years, service filter evaluated in the reader: no
+    # per-year frames, no concat, non-matching rows never reach pandas
+    scan_filter = pc.utf8_lower(ds.field('service')).isin(list(services))
+
+    # The amount filter joins the scan too, unless top merchants must be
+    # ranked on the pre-amount-filter sample or amounts are not numeric on disk
+    amount_expr = _amount_filter_expr(amount_filter)
+    amount_type = dataset.schema.field('trans_amount').type
+    amount_in_scan = (amount_expr is not None and not use_top_merchants
+                      and (pa.types.is_integer(amount_type) or pa.types.is_floating(amount_type)))
+    if amount_in_scan:
+        scan_filter = scan_filter & amount_expr
+
+    # Decode all year files concurrently (pyarrow releases the GIL)
+    table = dataset.to_table(columns=read_cols, filter=scan_filter, use_threads=True,
+                             fragment_readahead=max(len(dataset.files), 1))
+    log(f"After service{' + amount' if amount_in_scan else ''} filter: {table.num_rows:,}")
+
+    # Apply panel filter (constant individuals) on the Arrow table, before
+    # non-panel rows are converted to pandas
     if use_panel:
-        before_panel = len(trans)
+        before_panel = table.num_rows
         panel_cardids = _get_panel_cardids()
-        trans = trans[trans['cardid'].isin(panel_cardids)].copy()
-        pct_kept = 100 * len(trans) / before_panel if before_panel > 0 else 0
-        log(f"After panel filter: {len(trans):,} ({pct_kept:.1f}% of {before_panel:,})")
+        table = table.filter(pc.is_in(table.column('cardid'), value_set=panel_cardids))
+        pct_kept = 100 * table.num_rows / before_panel if before_panel > 0 else 0
+        log(f"After panel filter: {table.num_rows:,} ({pct_kept:.1f}% of {before_panel:,})")
+    # Few distinct services/merchants over many rows: keep them as categoricals
+    trans = table.to_pandas(
+        categories=[c for c in ('service', 'merchid') if c in table.column_names])
+
+    # Convert types; parse only if the parquet does not already store them typed
+    if not pd.api.types.is_datetime64_any_dtype(trans['trans_date']):
+        trans['trans_date'] = pd.to_datetime(trans['trans_date'])
+    if not pd.api.types.is_numeric_dtype(trans['trans_amount']):
+        trans['trans_amount'] = pd.to_numeric(trans['trans_amount'], errors='coerce')
 
-    # Convert types
-    trans['trans_date'] = pd.to_datetime(trans['trans_date'])
-    trans['trans_amount'] = pd.to_numeric(trans['trans_amount'], errors='coerce')
+    # Remaining filters build one mask, applied once at the end: no
+    # intermediate frames. take() returns an owned frame, so no .copy()
+    keep = np.ones(len(trans), dtype=bool)
 
     # Apply top merchants filter BEFORE amount filter
     # (top merchants defined on full sample)
     if use_top_merchants:
         top_merchs = _get_top_merchants(trans)
-        trans = trans[trans['merchid'].isin(top_merchs)].copy()
-        log(f"After top {TOP_N_MERCHANTS} merchants filter: {len(trans):,}")
+        keep &= trans['merchid'].isin(top_merchs).to_numpy()
+        log(f"After top {TOP_N_MERCHANTS} merchants filter: {keep.sum():,}")
 
     # Apply amount filter
-    if amount_filter == FILTER_PLUS_RANGE:
-        trans = trans[(trans['trans_amount'] >= 20) & (trans['trans_amount'] <= 22)].copy()
-        log(f"After $20-22 filter: {len(trans):,}")
+    amt = trans['trans_amount']
+    if amount_in_scan:
+        log(f"Amount filter '{amount_filter}' applied in scan: {len(trans):,}")
+    elif amount_filter == FILTER_PLUS_RANGE:
+        keep &= ((amt >= 20) & (amt <= 22)).to_numpy()
+        log(f"After $20-22 filter: {keep.sum():,}")
     elif amount_filter == FILTER_WIDE_RANGE:
-        trans = trans[(trans['trans_amount'] >= 15) & (trans['trans_amount'] <= 25)].copy()
-        log(f"After $15-25 filter: {len(trans):,}")
+        keep &= ((amt >= 15) & (amt <= 25)).to_numpy()
+        log(f"After $15-25 filter: {keep.sum():,}")
     elif amount_filter == FILTER_OUTSIDE:
-        trans = trans[(trans['trans_amount'] < 20) | (trans['trans_amount'] > 22)].copy()
-        log(f"After outside $20-22 filter: {len(trans):,}")
+        keep &= ((amt < 20) | (amt > 22)).to_numpy()
+        log(f"After outside $20-22 filter: {keep.sum():,}")
     else:
         log(f"No amount filter applied: {len(trans):,}")
 
+    if not keep.all():
+        trans = trans.take(np.flatnonzero(keep))
     return trans
 
 
@@ -129,21 +225,169 @@ def load_demographics():
     The old demographics CSV used cardid_address_map which had garbage data.
     """
     log("Loading card info with ZIP3...")
-    card_info = pd.read_parquet(DATA_DIR / "chatgpt_card_info_2025_12_26.parquet")
+    card_info = pd.read_parquet(DATA_DIR / "chatgpt_card_info_2025_12_26.parquet",
+                                columns=['cardid', 'zip'], engine='pyarrow')
     # zip is already 3-digit from card table
     card_info['zip3'] = card_info['zip'].astype(str)
     log(f"Card info: {len(card_info):,} cardids")
     return card_info[['cardid', 'zip3']]
 
 
+def _zip3_cache_path(services, years, amount_filter, use_top_merchants, use_panel):
+    """Cache file for one combination of load settings."""
+    # N is part of the name: the build depends on it, and freshness only
+    # checks input mtimes
+    merchants = f'top{TOP_N_MERCHANTS}' if use_top_merchants else 'allmerch'
+    sample = 'panel' if use_panel else 'full'
+    name = (f"trans_with_zip3_{'-'.join(services)}_{'-'.join(map(str, years))}"
+            f"_{amount_filter}_{merchants}_{sample}.parquet")
+    return ZIP3_CACHE_DIR / name
+
+
+def _zip3_cache_sources(years, use_panel):
+    """Input files whose changes invalidate the cache."""
+    sources = [DATA_DIR / f"chatgpt_transactions_{year}.parquet" for year in years]
+    sources.append(DATA_DIR / "chatgpt_card_info_2025_12_26.parquet")
+    if use_panel:
+        sources.append(DATA_DIR / "panel_cardlinkids.parquet")
+    return [f for f in sources if f.exists()]
+
+
 def load_with_zip3(services=('chatgpt', 'openai'), years=(2023, 2024, 2025),
-                   amount_filter=None, use_top_merchants=None, use_panel=None):
-    """Load transactions merged with zip3 from demographics."""
-    trans = load_transactions(services, years, amount_filter, use_top_merchants, use_panel)
-    demo = load_demographics()
+                   amount_filter=None, use_top_merchants=None, use_panel=None,
+                   columns=None, zip3_filter=None, row_filter=None):
+    """Load transactions merged with zip3 from demographics.
+
+    The merged result is cached as parquet in DERIVED_DIR/cache, keyed by the
+    load settings, and rebuilt when any input file is newer. This is the
+    handoff between scripts: only the first one pays for load_transactions.
+    Concurrent builders write to per-process temp files, so parallel
+    pipeline steps can't corrupt the cache. The cache is sorted by zip3, so
+    a zip3_filter read skips non-matching row groups.
+    zip3 is returned as a categorical; pass observed=True when grouping on it.
+
+    columns: columns to return (zip3 is always included). None returns all.
+    zip3_filter: if set (e.g. '606'), return only rows with this zip3.
+    row_filter: optional pyarrow.dataset expression (e.g. a trans_date
+        window), evaluated in the cache scan so excluded rows never reach
+        pandas. Filter columns need not be in `columns`.
+    """
+    if amount_filter is None:
+        amount_filter = AMOUNT_FILTER
+    if use_top_merchants is None:
+        use_top_merchants = USE_TOP_MERCHANTS
+    if use_panel is None:
+        use_panel = USE_PANEL
+
+    cache_path = _zip3_cache_path(services, years, amount_filter, use_top_merchants, use_panel)
+    read_cols = None
+    if columns is not None:
+        read_cols = list(dict.fromkeys([*columns, 'zip3']))
 
-    trans = trans.merge(demo[['cardid', 'zip3']], on='cardid', how='left')
-    trans['zip3'] = trans['zip3'].astype(str)
-    log(f"After zip3 merge: {len(trans):,} (matched: {trans['zip3'].notna().sum():,})")
+    sources = _zip3_cache_sources(years, use_panel)
+    if not cache_path.exists() or any(
+            f.stat().st_mtime > cache_path.stat().st_mtime for f in sources):
+        trans = load_transactions(services, years, amount_filter, use_top_merchants, use_panel)
+        demo = load_demographics()
 
+        # demo is a cardid -> zip3 lookup: map gathers into the existing frame
+        # instead of hash-joining into a new one
+        zip3_by_card = demo.drop_duplicates('cardid').set_index('cardid')['zip3']
+        trans['zip3'] = trans['cardid'].map(zip3_by_card).astype(str)
+        log(f"After zip3 merge: {len(trans):,} (matched: {trans['zip3'].notna().sum():,})")
+        trans = trans.sort_values('zip3', kind='stable', ignore_index=True)
+
+        # Dictionary encoding is a parquet page encoding here; the columns
+        # still read back as plain strings
+        ZIP3_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+        pq.write_table(pa.Table.from_pandas(trans, preserve_index=False), tmp_path,
+                       compression='zstd', use_dictionary=['zip3', 'cardid'],
+                       row_group_size=1_000_000)
+        os.replace(tmp_path, cache_path)
+        log(f"Cached to {cache_path}")
+        if row_filter is None:
+            if zip3_filter is not None:
+                trans = trans[trans['zip3'] == zip3_filter].reset_index(drop=True)
+            if read_cols is not None:
+                trans = trans[read_cols]
+            # assign returns a new frame: no chained assignment on the column slice
+            return trans.assign(zip3=trans['zip3'].astype('category'))
+        # Arrow expressions are evaluated by the scan: read back the new cache
+        del trans
+
+    log(f"Loading cached transactions with zip3 from {cache_path.name}...")
+    scan_filter = row_filter
+    if zip3_filter is not None:
+        zip3_expr = ds.field('zip3') == zip3_filter
+        scan_filter = zip3_expr if scan_filter is None else zip3_expr & scan_filter
+    if scan_filter is not None:
+        # Predicate pushed into the scan; row-group stats prune other ZIP3s
+        table = ds.dataset(cache_path, format='parquet').to_table(
+            columns=read_cols, filter=scan_filter
+        )
+    else:
+        table = pq.read_table(cache_path, columns=read_cols, memory_map=True, pre_buffer=True,
+                              use_threads=True)
+    # Few distinct values over many rows: compares and groupbys use int codes.
+    # Arrow dictionary-encodes zip3 during conversion, so no per-row Python
+    # strings are created on the way to the categorical.
+    trans = table.to_pandas(categories=['zip3'])
+    log(f"Transactions with zip3: {len(trans):,}")
     return trans
+
+
+def _read_dta_arrow(path):
+    """Read a .dta as an Arrow table, DTA_CHUNK_ROWS rows at a time.
+
+    Each chunk is converted to Arrow as soon as it is parsed, so the file never
+    exists as one pandas frame. Int columns come back as float in chunks that
+    contain missings; permissive promotion reconciles the chunk schemas.
+    """
+    tables = []
+    with pd.read_stata(path, chunksize=DTA_CHUNK_ROWS) as reader:
+        for chunk in reader:
+            if 'zip3' in chunk.columns:
+                chunk['zip3'] = chunk['zip3'].astype('category')
+            tables.append(pa.Table.from_pandas(chunk, preserve_index=False))
+    # One shared zip3 dictionary, as the Feather file format requires
+    return pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
+
+
+def read_dta_cached(path, columns=None, row_filter=None, sort_by=None):
+    """Read a Stata .dta through an uncompressed Feather copy in ZIP3_CACHE_DIR.
+
+    The plot scripts re-read the same synth/placebo .dta files on every run;
+    pd.read_stata parses them row by row. The first read writes a Feather copy
+    (zip3 dictionary-encoded), later reads memory-map only `columns` from it.
+    The copy is rebuilt when the .dta is newer. Copies are keyed by the .dta's
+    full path, since each sample's output dir has its own synth_results.dta.
+
+    row_filter: optional pyarrow.dataset expression (e.g.
+    ds.field('zip3_id') == 77), applied in the Arrow scan so only matching
+    rows are converted to pandas.
+    sort_by: if set, the copy is a parquet file sorted by this column in
+    small row groups instead, so a row_filter on that column reads only the
+    row groups whose min/max stats can match.
+    """
+    path = Path(path).resolve()
+    key = hashlib.md5(str(path).encode()).hexdigest()[:8]
+    fmt = 'feather' if sort_by is None else 'parquet'
+    suffix = '.feather' if sort_by is None else f'.{sort_by}.parquet'
+    cache_path = ZIP3_CACHE_DIR / f"{path.stem}_{key}{suffix}"
+    if not cache_path.exists() or os.path.getmtime(cache_path) < os.path.getmtime(path):
+        table = _read_dta_arrow(path)
+        ZIP3_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+        if sort_by is None:
+            feather.write_feather(table, tmp_path, compression='uncompressed')
+        else:
+            # Arrow's sort is stable, like the kind='stable' pandas sort
+            pq.write_table(table.sort_by(sort_by), tmp_path, row_group_size=SORTED_ROW_GROUP)
+        os.replace(tmp_path, cache_path)
+    if row_filter is not None:
+        return ds.dataset(cache_path, format=fmt).to_table(
+            columns=columns, filter=row_filter).to_pandas()
+    if sort_by is not None:
+        return pq.read_table(cache_path, columns=columns).to_pandas()
+    return feather.read_table(cache_path, columns=columns, memory_map=True).to_pandas()
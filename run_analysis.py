@@ -5,73 +5,258 @@ Master pipeline: export data -> run SC -> generate figures -> export macros.
 Usage:
     python run_analysis.py           # Full pipeline
     python run_analysis.py --quick   # Skip Stata (use existing results)
+    python run_analysis.py --force   # Rerun steps even if their inputs are unchanged
+    python run_analysis.py --from 3  # Resume at step 3 (e.g. after a failure)
+    python run_analysis.py --only 6  # Run just step 6
+
+Steps: 1 export panel (invalidates placebo results), 2 Stata SC, 3 donor
+weights, 4 SC figures, 5 exploratory plots, 6 placebo plots, 7 LaTeX macros.
+
+Steps with declared inputs/outputs (script_deps) are skipped when neither
+the script, config.py nor any input changed since their last successful run
+and all outputs exist. Run keys are kept in DERIVED_DIR/cache.
 """
 
+import argparse
+import asyncio
+import compileall
+import hashlib
+import json
+import os
+import signal
 import subprocess
 import sys
 from pathlib import Path
 
+from config import get_output_dir, DERIVED_DIR
+
 STATA = '/Applications/StataNow/StataMP.app/Contents/MacOS/stata-mp'
+PYTHON = sys.executable
 PROJECT_DIR = Path(__file__).parent
 
 
-def run(cmd, desc):
-    """Run a command and print status."""
+def run(argv, desc):
+    """Run a command (argv list, no shell) and print status."""
     print(f"\n{'='*60}")
     print(f"  {desc}")
     print(f"{'='*60}\n")
-    result = subprocess.run(cmd, shell=True, cwd=PROJECT_DIR)
-    if result.returncode != 0:
+    try:
+        subprocess.run(argv, cwd=PROJECT_DIR, check=True)
+    except subprocess.CalledProcessError:
         print(f"FAILED: {desc}")
         sys.exit(1)
     print(f"DONE: {desc}\n")
 
 
+# Longest output line relayed in one piece (progress bars redraw with \r)
+LINE_LIMIT = 1 << 20
+
+
+async def relay(argv, desc):
+    """Run one command, echoing its stdout/stderr line by line as [desc] ...
+
+    Lines are relayed as they arrive, so nothing is buffered beyond one line
+    and progress shows live. Returns the exit code. Cancelling the task
+    stops the command.
+    """
+    env = {**os.environ, 'PYTHONUNBUFFERED': '1'}  # children flush per line into the pipe
+    # Own process group, so stopping the job also stops any children
+    proc = await asyncio.create_subprocess_exec(
+        *argv, cwd=PROJECT_DIR, env=env, limit=LINE_LIMIT,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True)
+    try:
+        async for line in proc.stdout:
+            sys.stdout.write(f"  [{desc}] {line.decode(errors='replace')}")
+            sys.stdout.flush()
+        return await proc.wait()
+    except asyncio.CancelledError:
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass  # exited on its own meanwhile
+        await proc.wait()
+        raise
+
+
+async def gather_jobs(jobs):
+    """Await the (argv, desc) jobs; on the first failure cancel the rest.
+
+    Returns the description of the failed job, or None.
+    """
+    tasks = {asyncio.create_task(relay(argv, desc)): desc for argv, desc in jobs}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        failed = None
+        for task in done:
+            desc = tasks[task]
+            if task.result() == 0:
+                print(f"DONE: {desc}")
+            else:
+                print(f"FAILED: {desc} (stopping the other jobs)")
+                failed = failed or desc
+        if failed:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    print(f"STOPPED: {tasks[task]}")
+            return failed
+    return None
+
+
+def run_parallel(jobs):
+    """Run independent (argv, desc) jobs concurrently.
+
+    Each job's output streams live, prefixed with its description so the
+    interleaved lines stay attributable. Fails fast: the first failure stops
+    the other jobs, then exits.
+    """
+    print(f"\n{'='*60}")
+    for _, desc in jobs:
+        print(f"  {desc}")
+    print(f"{'='*60}\n")
+    if asyncio.run(gather_jobs(jobs)):
+        sys.exit(1)
+
+
+def script_deps(outdir):
+    """Declared (inputs, outputs) of the steps that can be skipped when unchanged."""
+    panel = PROJECT_DIR / 'data' / 'synth_panel.dta'
+    synth_log = PROJECT_DIR / 'chicago_synth.log'
+    results = outdir / 'synth_results.dta'
+    weights = outdir / 'synth_donor_weights.csv'
+    return {
+        'code/analysis/extract_donor_weights.py':
+            ([synth_log, PROJECT_DIR / 'data' / 'zip3_id_mapping.csv'], [weights]),
+        'code/analysis/plot_synth_with_o1.py':
+            ([results], [outdir / 'chicago_synth_with_o1.png']),
+        'code/analysis/chicago_spaghetti_plot.py':
+            ([panel, weights], [outdir / 'chicago_spaghetti_donors.png']),
+        'code/analysis/export_synth_results_tex.py':
+            ([results, weights, synth_log, panel, outdir / 'placebo_rmspe_results.csv'],
+             [PROJECT_DIR / 'memos' / 'synth_macros.tex']),
+    }
+
+
+def job_key(script, inputs):
+    """Hash of the script and config.py sources plus each input's mtime and size."""
+    h = hashlib.blake2b(digest_size=16)
+    for src in (PROJECT_DIR / script, PROJECT_DIR / 'config.py'):
+        h.update(src.read_bytes())
+    for f in inputs:
+        stamp = f'{f.stat().st_mtime_ns}:{f.stat().st_size}' if f.exists() else 'absent'
+        h.update(f'{f}:{stamp}'.encode())
+    return h.hexdigest()
+
+
+def run_stale(jobs, deps, manifest, manifest_path):
+    """run_parallel the jobs that aren't up to date, then record their run keys."""
+    todo, keys = [], {}
+    for argv, desc in jobs:
+        script = argv[1]
+        if script in deps:
+            inputs, outputs = deps[script]
+            key = job_key(script, inputs)
+            if manifest.get(script) == key and all(f.exists() for f in outputs):
+                print(f"\n[up to date] {desc}")
+                continue
+            keys[script] = key
+        todo.append((argv, desc))
+    if todo:
+        run_parallel(todo)
+    manifest.update(keys)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, manifest_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export data -> run SC -> generate figures -> export macros.")
+    parser.add_argument('--quick', action='store_true',
+                        help="Skip Stata (use existing results)")
+    parser.add_argument('--force', action='store_true',
+                        help="Rerun steps even if their inputs are unchanged")
+    parser.add_argument('--from', dest='start', type=int, default=1, choices=range(1, 8),
+                        metavar='STEP', help="Resume at this step (1-7)")
+    parser.add_argument('--only', type=int, choices=range(1, 8), metavar='STEP',
+                        help="Run just this step (1-7)")
+    return parser.parse_args()
+
+
 def main():
-    quick = '--quick' in sys.argv
+    args = parse_args()
+    steps = {args.only} if args.only else set(range(args.start, 8))
 
-    # Step 1: Export panel data (invalidates old placebo results)
-    from config import get_output_dir
     outdir = get_output_dir()
-    placebo_files = [
-        outdir / 'placebo_results_topq.dta',
-        outdir / 'placebo_series_long.dta',
-        outdir / 'placebo_results_new.dta',
-    ]
-    for f in placebo_files:
-        if f.exists():
-            f.unlink()
-            print(f"Deleted stale: {f.name}")
+    manifest_path = DERIVED_DIR / 'cache' / 'run_analysis_manifest.json'
+    manifest = {}
+    if manifest_path.exists() and not args.force:
+        manifest = json.loads(manifest_path.read_text())
+    deps = script_deps(outdir)
+
+    # Write .pyc for config/load_data and the helper modules up front, so
+    # the parallel steps don't each compile them on first import
+    compileall.compile_dir(PROJECT_DIR, maxlevels=0, quiet=2, workers=0)
+    compileall.compile_dir(PROJECT_DIR / 'code', quiet=2, workers=0)
+
+    # Step 1: Export panel data (invalidates old placebo results). The
+    # invalidation is part of the step, so it fires whenever the export runs.
+    if 1 in steps:
+        placebo_files = [
+            outdir / 'placebo_results_topq.dta',
+            outdir / 'placebo_series_long.dta',
+            outdir / 'placebo_results_new.dta',
+        ]
+        for f in placebo_files:
+            if f.exists():
+                f.unlink()
+                print(f"Deleted stale: {f.name}")
 
-    run('python3 code/analysis/export_synth_data.py', 'Export panel data to Stata')
+        run([PYTHON, 'code/analysis/export_synth_data.py'], 'Export panel data to Stata')
 
     # Step 2: Run main synthetic control (skip if --quick)
-    if not quick:
-        run(f'{STATA} -b do chicago_synth.do', 'Run synthetic control')
-    else:
-        print("\n[--quick] Skipping Stata, using existing results\n")
+    if 2 in steps:
+        if not args.quick:
+            run([STATA, '-b', 'do', 'chicago_synth.do'], 'Run synthetic control')
+        else:
+            print("\n[--quick] Skipping Stata, using existing results\n")
 
     # Step 3: Extract donor weights from log
-    run('python3 code/analysis/extract_donor_weights.py', 'Extract donor weights')
+    if 3 in steps:
+        run_stale([([PYTHON, 'code/analysis/extract_donor_weights.py'], 'Extract donor weights')],
+                  deps, manifest, manifest_path)
 
-    # Step 4: Generate main SC figures
-    run('python3 code/analysis/plot_synth_with_o1.py', 'Plot SC with event lines')
-    run('python3 code/analysis/chicago_spaghetti_plot.py', 'Plot donor spaghetti')
-
-    # Step 5: Exploratory plots
-    run('python3 code/exploratory/detect_tax_changes.py', 'Detect tax changes')
-    run('python3 code/plot_chicago_vs_rest.py', 'Chicago vs rest raw plot')
+    # Steps 4-7 only read outputs that exist after step 3 and write separate
+    # files, so they run side by side. The exploratory reports share one
+    # transactions load via run_reports.py, so only one process holds the
+    # transaction sample in memory.
+    jobs = [
+        (4, [PYTHON, 'code/analysis/plot_synth_with_o1.py'], 'Plot SC with event lines'),
+        (4, [PYTHON, 'code/analysis/chicago_spaghetti_plot.py'], 'Plot donor spaghetti'),
+        (5, [PYTHON, 'code/exploratory/run_reports.py',
+             'tax-changes', 'chicago-vs-rest', 'chicago-raw-counts'],
+         'Detect tax changes + Chicago vs rest + raw counts plots'),
+        (7, [PYTHON, 'code/analysis/export_synth_results_tex.py'], 'Export LaTeX macros'),
+    ]
 
     # Step 6: Placebo robustness plots (if placebo results exist)
-    from config import get_output_dir
-    placebo_results = get_output_dir() / 'placebo_results_topq.dta'
-    if placebo_results.exists():
-        run('python3 code/robustness/run_placebo_plots.py 2', 'Placebo plots (2x)')
-    else:
-        print("\n[Skipping placebo plots - run placebo tests first]\n")
-
-    # Step 7: Export LaTeX macros
-    run('python3 code/analysis/export_synth_results_tex.py', 'Export LaTeX macros')
+    if 6 in steps:
+        placebo_results = outdir / 'placebo_results_topq.dta'
+        if placebo_results.exists():
+            jobs.append((6, [PYTHON, 'code/robustness/run_placebo_plots.py', '2'],
+                         'Placebo plots (2x)'))
+        else:
+            print("\n[Skipping placebo plots - run placebo tests first]\n")
+
+    jobs = [(argv, desc) for step, argv, desc in jobs if step in steps]
+    if jobs:
+        run_stale(jobs, deps, manifest, manifest_path)
 
     print("\n" + "="*60)
     print("  PIPELINE COMPLETE")